@@ -1,2 +1,10 @@
 from .colors import *
 from .tools import *
+from .arrays import *
+from .index import *
+from .stream import *
+from .lut import *
+from .boundary import *
+from .palette import *
+from .distance import *
+from .instrument import *
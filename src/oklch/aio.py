@@ -0,0 +1,174 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from . import tools
+from . import arrays
+
+import asyncio
+
+# Awaitable versions of the bulk operations, for use from within an asyncio
+#   event loop (in a web service, for example). Everything else in the module
+#   is pure python and would block the loop for as long as it runs, so batches
+#   are split into chunks which are run one at a time on an executor; the loop
+#   is free to serve other tasks while each chunk runs.
+#
+# executor may be any concurrent.futures executor; None uses the loop's default
+#   thread pool. Threads keep the loop responsive, but share the GIL, so they
+#   don't make the work itself any faster; a ProcessPoolExecutor does, at the
+#   cost of pickling each chunk to and from the workers. Any op sent to a
+#   process pool must be picklable; that is, a function defined at the top
+#   level of a module, not a lambda.
+#
+# Cancelling a call stops it from submitting any further chunks. A chunk which
+#   has already started will still run to completion on the executor, so
+#   chunksize also bounds how long the executor stays busy after cancellation.
+
+DEFAULT_CHUNKSIZE = 1024
+
+_TYPES = ('RGB', 'HEX', 'OKLAB', 'OKLCH')
+
+# Runs fn on each chunk of items in turn, returning the list of results
+async def _run_chunks(fn, items, args, executor, chunksize):
+    if not (isinstance(chunksize, int) and chunksize > 0):
+        raise ValueError("Expected a positive integer, received" \
+                            + f" '{chunksize}'!")
+
+    loop = asyncio.get_running_loop()
+    if not isinstance(items, arrays.ColorArray):
+        items = list(items)
+    chunks = (items[i:i+chunksize] for i in range(0, len(items), chunksize))
+
+    ret = []
+    for chunk in chunks:
+        ret.append(await loop.run_in_executor(executor, fn, chunk, *args))
+    return ret
+
+# Joins the results of each chunk back together
+def _join(results, items):
+    if not results:
+        return type(items)() if isinstance(items, arrays.ColorArray) else []
+    if isinstance(results[0], arrays.ColorArray):
+        ret = type(results[0])()
+        for r in results:
+            ret.data.extend(r.data)
+        return ret
+    return [x for r in results for x in r]
+
+# The functions below run on the executor
+def _convert_chunk(chunk, to):
+    if isinstance(chunk, arrays.ColorArray):
+        return getattr(chunk, 'to_' + to)()
+    ret = []
+    for color in chunk:
+        colors.Color._is_color(color)
+        ret.append(getattr(color, 'to_' + to)())
+    return ret
+
+def _gamut_clip_chunk(chunk, method):
+    if isinstance(chunk, arrays.ColorArray):
+        return arrays.gamut_clip(chunk, method=method)
+    clip = tools._get_gamut_clip(method)
+    ret = []
+    for color in chunk:
+        colors.Color._is_color(color)
+        ret.append(clip(color))
+    return ret
+
+def _nearest_chunk(chunk, n, index):
+    if index is None:
+        return [colors.Color.get_nearest_web_color(c, n) for c in chunk]
+    return [index.nearest(c, n) for c in chunk]
+
+def _map_chunk(chunk, op, args, kwargs):
+    return [op(*args, color, **kwargs) for color in chunk]
+
+# Converts every color to the given type ('RGB', 'HEX', 'OKLAB', or 'OKLCH').
+#   color_list may be a list of colors, giving a list, or a color array, giving
+#   an array of the new type (or a list of strings, for 'HEX').
+async def convert(color_list, to,
+                  executor = None,
+                  chunksize = DEFAULT_CHUNKSIZE):
+
+    if to not in _TYPES:
+        raise ValueError(f"""Unknown type: '{to}'!
+Valid types are 'RGB', 'HEX', 'OKLAB', and 'OKLCH'.""")
+    if isinstance(color_list, arrays.ColorArray) and not len(color_list):
+        return _convert_chunk(color_list, to)
+
+    return _join(await _run_chunks(_convert_chunk, color_list, (to,),
+                                   executor, chunksize),
+                 color_list)
+
+# Clips every out-of-gamut color into gamut with the given method (as in
+#   arrays.gamut_clip()). color_list may be a list of colors, or an OKLCH or
+#   OKLAB array, giving an array of the same type.
+async def gamut_clip(color_list,
+                     method = 'hue_dependent',
+                     executor = None,
+                     chunksize = DEFAULT_CHUNKSIZE):
+
+    if method not in ('hue_dependent', 'hue_independent',
+                      'preserve_lightness'):
+        raise ValueError(f"""Unknown method: '{method}'!
+Valid methods are 'hue_dependent', 'hue_independent', and 'preserve_lightness'.""")
+    if isinstance(color_list, arrays.ColorArray) \
+            and not isinstance(color_list, (arrays.OKLCHArray,
+                                            arrays.OKLABArray)):
+        raise ValueError("Expected OKLCH or OKLAB array, received" \
+                            + f" '{type(color_list)}'!")
+
+    return _join(await _run_chunks(_gamut_clip_chunk, color_list, (method,),
+                                   executor, chunksize),
+                 color_list)
+
+# Finds the n nearest colors to each color, as a list in input order. Without
+#   an index, each result is the same as Color.get_nearest_web_color(color, n)
+#   would give; otherwise, it is the same as index.nearest(color, n).
+async def nearest(color_list,
+                  n = 1,
+                  index = None,
+                  executor = None,
+                  chunksize = DEFAULT_CHUNKSIZE):
+
+    if not (isinstance(n, int) and n > 0):
+        raise ValueError(f"Expected a positive integer, received '{n}'!")
+
+    return _join(await _run_chunks(_nearest_chunk, color_list, (n, index),
+                                   executor, chunksize),
+                 [])
+
+# Applies op to every color, returning a list of the results in input order.
+#   As in tools.map_parallel(), each color is passed following any other
+#   positional arguments, i.e. op(*args, color, **kwargs).
+async def map(op, color_list, *args,
+              executor = None,
+              chunksize = DEFAULT_CHUNKSIZE,
+              **kwargs):
+
+    if not callable(op):
+        raise ValueError(f"Expected callable, received '{type(op)}'!")
+
+    return _join(await _run_chunks(_map_chunk, color_list,
+                                   (op, args, kwargs), executor, chunksize),
+                 [])
+
+# The same as tools.gradient() and tools.multi_gradient(). Each gradient is
+#   generated in a single call on the executor.
+async def gradient(color1, color2, n,
+                   method = 'shortest',
+                   clip = 'preserve_lightness',
+                   executor = None):
+
+    return await multi_gradient([color1, color2], n, method=method, clip=clip,
+                                executor=executor)
+
+async def multi_gradient(stops, n,
+                         method = 'shortest',
+                         clip = 'preserve_lightness',
+                         executor = None):
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _multi_gradient,
+                                      list(stops), n, method, clip)
+
+def _multi_gradient(stops, n, method, clip):
+    return tools.multi_gradient(stops, n, method=method, clip=clip)
@@ -0,0 +1,502 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from . import tools
+
+import math
+from array import array
+
+# Color arrays store many colors of the same type in a single contiguous buffer
+#   of doubles laid out as [x0, y0, z0, x1, y1, z1, ...], i.e. an (N, 3) array
+#   in row-major order. Conversions between them perform exactly the same
+#   arithmetic as the scalar classes in colors.py, just hoisted out of the
+#   per-object method calls, so the results are identical to converting each
+#   color individually (to within 1e-12, and in practice bit-for-bit).
+#
+# Arrays can also wrap any object exposing the buffer protocol (bytearray,
+#   array.array, mmap, NumPy arrays, ...) without copying it, with from_buffer().
+#   Such arrays may hold uint8 ('B'), float32 ('f'), or float64 ('d') values,
+#   either interleaved as above or planar, i.e. [x0, x1, ..., y0, y1, ...,
+#   z0, z1, ...]. Conversions always give new float64 arrays, and any array's
+#   data can be exported in place with to_buffer().
+
+# The typecode of an array's data, whether an array.array or a memoryview
+def _typecode(data):
+    if isinstance(data, array):
+        return data.typecode
+    return data.format
+
+def _itemsize(typecode):
+    return array(typecode).itemsize
+
+# The superclass is only used for type-checking and should not be used directly
+class ColorArray:
+    # The scalar color class this array holds; set by each subclass
+    _color_type = colors.Color
+    # The typecodes which from_buffer() accepts
+    _typecodes = ('f', 'd')
+    # Whether data holds each channel in turn rather than interleaved triplets
+    planar = False
+
+    def __init__(self, data=()):
+        if isinstance(data, array) and data.typecode == 'd':
+            self.data = array('d', data)
+        else:
+            self.data = array('d', (float(x) for x in data))
+
+        if len(self.data) % 3:
+            raise ValueError("Expected a flat sequence of triplets, received" \
+                                + f" {len(self.data)} values!")
+
+    # Alternative constructors
+    @classmethod
+    def from_triplets(cls, triplets):
+        data = array('d')
+        for t in triplets:
+            data.extend(t)
+        return cls(data)
+    @classmethod
+    def from_colors(cls, color_list):
+        ret = cls()
+        for c in color_list:
+            colors.Color._is_color(c)
+            ret.data.extend(cls._unpack(cls._convert(c)))
+        return ret
+    # Builds an array from three equal-length sequences of components
+    @classmethod
+    def _from_channels(cls, x, y, z):
+        ret = cls()
+        ret.data = array('d', bytes(24 * len(x)))
+        ret.data[0::3] = array('d', x)
+        ret.data[1::3] = array('d', y)
+        ret.data[2::3] = array('d', z)
+        return ret
+
+    # Wraps buffer as an array without copying it. The typecode defaults to the
+    #   buffer's own format, and layout may be 'interleaved' or 'planar'. 
+    @classmethod
+    def from_buffer(cls, buffer, typecode = None, layout = 'interleaved'):
+        view = memoryview(buffer)
+        if typecode is None:
+            typecode = view.format.lstrip('@=<')
+        if typecode not in cls._typecodes:
+            raise ValueError(f"Unknown typecode: '{typecode}'! Valid typecodes"
+                                + f" for {cls.__name__} are"
+                                + f" {', '.join(map(repr, cls._typecodes))}.")
+        if layout not in ('interleaved', 'planar'):
+            raise ValueError(f"""Unknown layout: '{layout}'!
+Valid layouts are 'interleaved' and 'planar'.""")
+        if not view.c_contiguous:
+            raise ValueError("Expected a contiguous buffer!")
+
+        # Flatten any shape (such as a (N, 3) NumPy array) and reinterpret
+        view = view.cast('B')
+        if len(view) % (3 * _itemsize(typecode)):
+            raise ValueError("Expected a flat sequence of triplets, received" \
+                                + f" {len(view)} bytes!")
+
+        ret = cls.__new__(cls)
+        ret.data = view.cast(typecode)
+        ret.planar = layout == 'planar'
+        return ret
+
+    # Returns the three component sequences of the array
+    def _channels(self):
+        if self.planar:
+            n = len(self)
+            return self.data[:n], self.data[n:2*n], self.data[2*n:]
+        return self.data[0::3], self.data[1::3], self.data[2::3]
+
+    # Exports the array's data as a memoryview. If the typecode and layout
+    #   already match the array's, this is a view of the array itself, so
+    #   writes through it change the array; otherwise, the data is converted
+    #   into a new buffer. Only RGB arrays can be exported as uint8 ('B'), with
+    #   each channel rounded and clamped to [0,255]. 
+    def to_buffer(self, typecode = 'd', layout = 'interleaved'):
+        if typecode not in self._typecodes:
+            raise ValueError(f"Unknown typecode: '{typecode}'! Valid typecodes"
+                                + f" for {type(self).__name__} are"
+                                + f" {', '.join(map(repr, self._typecodes))}.")
+        if layout not in ('interleaved', 'planar'):
+            raise ValueError(f"""Unknown layout: '{layout}'!
+Valid layouts are 'interleaved' and 'planar'.""")
+
+        if _typecode(self.data) == typecode \
+                and self.planar == (layout == 'planar'):
+            return memoryview(self.data).cast('B').cast(typecode)
+
+        x, y, z = self._channels()
+        if typecode == 'B':
+            x, y, z = ([min(255, max(0, colors._round(v))) for v in channel] \
+                           for channel in (x, y, z))
+        ret = array(typecode, bytes(3 * len(self) * _itemsize(typecode)))
+        if layout == 'planar':
+            n = len(self)
+            ret[:n] = array(typecode, x)
+            ret[n:2*n] = array(typecode, y)
+            ret[2*n:] = array(typecode, z)
+        else:
+            ret[0::3] = array(typecode, x)
+            ret[1::3] = array(typecode, y)
+            ret[2::3] = array(typecode, z)
+        return memoryview(ret)
+
+    # Allows memoryview(array) directly on Python 3.12+
+    def __buffer__(self, flags):
+        return memoryview(self.data)
+
+    # Gets the components of a scalar color of this array's type
+    @staticmethod
+    def _unpack(color):
+        return ()
+    # Converts a scalar color to this array's type
+    @staticmethod
+    def _convert(color):
+        return color
+    # Makes a scalar color of this array's type
+    @classmethod
+    def _pack(cls, x, y, z):
+        return cls._color_type(x, y, z)
+
+    def __len__(self):
+        return len(self.data) // 3
+    # Reads only the values needed from data, rather than copying out whole
+    #   channels, so indexing is O(1) and slicing is O(length of the slice)
+    def __getitem__(self, i):
+        n = len(self)
+        data = self.data
+        # Component k of color j is at data[k * offset + j * stride]
+        stride, offset = (1, n) if self.planar else (3, 1)
+
+        if isinstance(i, slice):
+            indices = range(*i.indices(n))
+            if not indices:
+                return self._from_channels((), (), ())
+            step = indices.step * stride
+            channels = []
+            for k in range(3):
+                first = k * offset + indices[0] * stride
+                last = k * offset + indices[-1] * stride
+                if step > 0:
+                    end = last + 1
+                else:
+                    end = last - 1 if last else None
+                channels.append(data[first:end:step])
+            return self._from_channels(*channels)
+
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("Color array index out of range!")
+        i *= stride
+        return self._pack(data[i], data[i + offset], data[i + 2 * offset])
+    def __iter__(self):
+        for x, y, z in zip(*self._channels()):
+            yield self._pack(x, y, z)
+
+    def __str__(self):
+        return f"{type(self).__name__}({len(self)} colors)"
+
+    def to_list(self):
+        return list(self)
+    def to_triplets(self):
+        return list(zip(*self._channels()))
+
+    # Type Conversions
+    def to_RGB(self):
+        return self.to_OKLAB().to_RGB()
+    def to_HEX(self):
+        return self.to_RGB().to_HEX()
+    def to_OKLAB(self):
+        return self.to_OKLCH().to_OKLAB()
+    def to_OKLCH(self):
+        return self.to_OKLAB().to_OKLCH()
+
+# RGB colors stored as triplets of floats in [0,255]
+class RGBArray(ColorArray):
+    _color_type = colors.RGB
+    _typecodes = ('B', 'f', 'd')
+
+    @staticmethod
+    def _convert(color):
+        return color.to_RGB()
+    @staticmethod
+    def _unpack(color):
+        return (color.r, color.g, color.b)
+    # Integral channels are given back as ints to match colors.RGB
+    @classmethod
+    def _pack(cls, r, g, b):
+        return colors.RGB(*(int(x) if float(x).is_integer() else x \
+                                for x in (r, g, b)))
+
+    @classmethod
+    def from_hex(cls, hex_codes):
+        data = array('d')
+        for h in hex_codes:
+            if h[0] == '#':
+                h = h[1:]
+            data.extend((int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)))
+        return cls(data)
+
+    # Type Conversions
+    def to_RGB(self):
+        return self
+    # HEX has no array type, so this gives a list of hex code strings instead
+    def to_HEX(self):
+        return ["#{:0>2}{:0>2}{:0>2}".format(
+                    colors._hex(int(r)),
+                    colors._hex(int(g)),
+                    colors._hex(int(b)))
+                for r, g, b in zip(*self._channels())]
+    def to_OKLAB(self, use_lut=True):
+        if use_lut and colors._rgb_lut is not None:
+            return colors._rgb_lut.convert(self)
+
+        linearize = colors._linearize
+        pow = math.pow
+        L, A, B = [], [], []
+        # Whole channels are passed as ints to use the transfer function table
+        channels = self._channels()
+        if _typecode(self.data) != 'B':
+            channels = ([int(x) if x.is_integer() else x for x in channel] \
+                            for channel in channels)
+        for r, g, b in zip(*channels):
+            r = linearize(r)
+            g = linearize(g)
+            b = linearize(b)
+
+            l_ = pow(0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b,
+                     1/3)
+            m_ = pow(0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b,
+                     1/3)
+            s_ = pow(0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b,
+                     1/3)
+
+            L.append(0.2104542553*l_ + 0.7936177850*m_ - 0.0040720468*s_)
+            A.append(1.9779984951*l_ - 2.4285922050*m_ + 0.4505937099*s_)
+            B.append(0.0259040371*l_ + 0.7827717662*m_ - 0.8086757660*s_)
+        return OKLABArray._from_channels(L, A, B)
+
+# OKLAB colors stored as triplets
+class OKLABArray(ColorArray):
+    _color_type = colors.OKLAB
+
+    @staticmethod
+    def _convert(color):
+        return color.to_OKLAB()
+    @staticmethod
+    def _unpack(color):
+        return (color.l, color.a, color.b)
+
+    # Type Conversions
+    def to_RGB(self):
+        encode = colors._encode
+        R, G, B = [], [], []
+        for L, a, b in zip(*self._channels()):
+            l_ = L + 0.3963377774 * a + 0.2158037573 * b
+            m_ = L - 0.1055613458 * a - 0.0638541728 * b
+            s_ = L - 0.0894841775 * a - 1.2914855480 * b
+
+            l = l_*l_*l_
+            m = m_*m_*m_
+            s = s_*s_*s_
+
+            R.append(encode(+4.0767416621 * l \
+                    - 3.3077115913 * m \
+                    + 0.2309699292 * s))
+            G.append(encode(-1.2684380046 * l \
+                    + 2.6097574011 * m \
+                    - 0.3413193965 * s))
+            B.append(encode(-0.0041960863 * l \
+                    - 0.7034186147 * m \
+                    + 1.7076147010 * s))
+        return RGBArray._from_channels(R, G, B)
+    def to_OKLAB(self):
+        return self
+    def to_OKLCH(self):
+        atan2 = math.atan2
+        degrees = math.degrees
+        pow = math.pow
+        C, H = [], []
+        L, A, B = self._channels()
+        for a, b in zip(A, B):
+            C.append(pow(a ** 2 + b ** 2, 0.5))
+            h = degrees(atan2(b, a))
+            if h < 0:
+                h += 360
+            H.append(h)
+        return OKLCHArray._from_channels(L, C, H)
+
+# OKLCH colors stored as triplets
+class OKLCHArray(ColorArray):
+    _color_type = colors.OKLCH
+
+    @staticmethod
+    def _convert(color):
+        return color.to_OKLCH()
+    @staticmethod
+    def _unpack(color):
+        return (color.l, color.c, color.h)
+
+    # Type Conversions
+    def to_OKLAB(self):
+        cos = math.cos
+        sin = math.sin
+        radians = math.radians
+        A, B = [], []
+        L, C, H = self._channels()
+        for c, h in zip(C, H):
+            A.append(cos(radians(h)) * c)
+            B.append(sin(radians(h)) * c)
+        return OKLABArray._from_channels(L, A, B)
+    def to_OKLCH(self):
+        return self
+
+# Returns a list of booleans giving whether each color of an array is in gamut.
+#   By default, this matches each color's is_in_gamut() exactly; if epsilon is
+#   given, each linear RGB channel must instead be within [-epsilon,
+#   1 + epsilon]. 
+def in_gamut_mask(array, epsilon = None):
+    if not isinstance(array, ColorArray):
+        raise ValueError(f"Expected color array, received '{type(array)}'!")
+
+    if isinstance(array, RGBArray):
+        R, G, B = array._channels()
+        if epsilon is None:
+            return [max(r, g, b) <= 255 and min(r, g, b) >= 0 \
+                        for r, g, b in zip(R, G, B)]
+        linearize = colors._linearize
+        lo = -epsilon
+        hi = 1 + epsilon
+        return [lo <= linearize(r) <= hi and lo <= linearize(g) <= hi \
+                    and lo <= linearize(b) <= hi for r, g, b in zip(R, G, B)]
+
+    is_in_gamut = colors._is_in_gamut
+    return [is_in_gamut(l, a, b, epsilon) \
+                for l, a, b in zip(*array.to_OKLAB()._channels())]
+
+###############################################################################
+#
+# Batch gamut clipping
+#
+# gamut_clip() follows the same approach as tools._find_gamut_intersection(),
+#   but over a whole array at once: the cusp is found once per distinct hue,
+#   and the upper-half Halley refinement runs for at most iterations steps
+#   over only those colors which have not yet converged into gamut. Any which
+#   are still out of gamut after that are bisected into gamut, so every color
+#   is the same as the scalar 'exact' precision gives, and always in gamut.
+#   Both steps are shared with tools, through _halley_step() and
+#   _bisect_into_gamut().
+#
+###############################################################################
+
+# Finds the cusp for each of the given hues, computing each distinct hue once
+def _find_cusps(H, use_table=False):
+    cusps = {}
+    for h in H:
+        if h not in cusps:
+            cusp = tools.find_cusp(hue=h, use_table=use_table)
+            cusps[h] = (cusp.l, cusp.c)
+    return [cusps[h] for h in H]
+
+# Clips every out-of-gamut color in an OKLCH or OKLAB array into gamut. The
+#   returned array is of the same type as the one provided; colors which are
+#   already in-gamut are left unmodified. 
+def gamut_clip(array,
+               method = 'hue_dependent',
+               iterations = None,
+               use_table = False):
+
+    if not isinstance(array, (OKLCHArray, OKLABArray)):
+        raise ValueError("Expected OKLCH or OKLAB array, received" \
+                            + f" '{type(array)}'!")
+    if iterations is None:
+        iterations = tools.MAX_GAMUT_ITERATIONS
+    if not (isinstance(iterations, int) and iterations >= 0):
+        raise ValueError("Expected a non-negative integer, received" \
+                            + f" '{iterations}'!")
+    if method not in ('hue_dependent', 'hue_independent',
+                      'preserve_lightness'):
+        raise ValueError(f"""Unknown method: '{method}'!
+Valid methods are 'hue_dependent', 'hue_independent', and 'preserve_lightness'.""")
+
+    lch = array.to_OKLCH()
+    L_in, C_in, H = lch._channels()
+    L, C, H = list(L_in), list(C_in), list(H)
+
+    # Only out-of-gamut colors need to be clipped
+    todo = [i for i, ok in enumerate(in_gamut_mask(array)) if not ok]
+    if not todo:
+        return type(array)._from_channels(*array._channels())
+
+    cusps = _find_cusps([H[i] for i in todo], use_table)
+    L0s = {}
+
+    # Colors in the upper half which still need refining, as tuples of
+    #   (index, a, b, L0, t, k_l, k_m, k_s, l_dt, m_dt, s_dt)
+    upper = []
+    for i, (cusp_l, cusp_c) in zip(todo, cusps):
+        L1 = L[i]
+        C1 = C[i]
+        h = H[i]
+
+        if method == 'hue_dependent':
+            L0 = cusp_l
+        elif method == 'hue_independent':
+            L0 = 0.5
+        else:
+            L0 = min(1, max(0, L1))
+        L0s[i] = L0
+
+        if (((L1 - L0) * cusp_c - (cusp_l - L0) * C1) <= 0.):
+            # Lower half
+            t = cusp_c * L0 / (C1 * cusp_l + cusp_c * (L0 - L1))
+        else:
+            # Upper half; first intersect with triangle
+            t = cusp_c * (L0 - 1.) / (C1 * (cusp_l - 1.) + \
+                cusp_c * (L0 - L1))
+
+            a, b = colors.OKLCH._get_normalized_ab(h)
+            dL = L1 - L0
+            dC = C1
+
+            k_l = +0.3963377774 * a + 0.2158037573 * b
+            k_m = -0.1055613458 * a - 0.0638541728 * b
+            k_s = -0.0894841775 * a - 1.2914855480 * b
+
+            upper.append((i, a, b, L0, t, k_l, k_m, k_s,
+                          dL + dC * k_l, dL + dC * k_m, dL + dC * k_s))
+
+        L[i] = L0 * (1 - t) + t * L1
+        C[i] = t * C1
+
+    # Halley's method, run only on those colors which are not yet in gamut
+    is_in_gamut = colors._is_in_gamut
+    for _ in range(iterations):
+        upper = [u for u in upper \
+                    if not is_in_gamut(L[u[0]], u[1] * C[u[0]], u[2] * C[u[0]])]
+        if not upper:
+            break
+
+        remaining = []
+        for i, ha, hb, L0, t, k_l, k_m, k_s, l_dt, m_dt, s_dt in upper:
+            t += tools._halley_step(L[i], C[i], k_l, k_m, k_s,
+                                    l_dt, m_dt, s_dt)
+            L[i] = L0 * (1 - t) + t * L_in[i]
+            C[i] = t * C_in[i]
+            remaining.append((i, ha, hb, L0, t, k_l, k_m, k_s,
+                              l_dt, m_dt, s_dt))
+        upper = remaining
+
+    # Anything still not in gamut is bisected into gamut, exactly as in
+    #   tools._find_gamut_intersection()
+    for i, (cusp_l, cusp_c) in zip(todo, cusps):
+        ha, hb = colors.OKLCH._get_normalized_ab(H[i])
+        if not is_in_gamut(L[i], ha * C[i], hb * C[i]):
+            L[i], C[i], _ = tools._bisect_into_gamut(L[i], C[i], L0s[i],
+                                                     L_in[i], C_in[i], cusp_l,
+                                                     ha, hb)
+
+    ret = OKLCHArray._from_channels(L, C, H)
+    if isinstance(array, OKLABArray):
+        return ret.to_OKLAB()
+    return ret
@@ -0,0 +1,233 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from . import tools
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# Benchmarks for the hot paths of the module. Run with:
+#   python -m oklch.bench [--sizes N ...] [--save FILE] [--compare FILE]
+#
+# Each benchmark is timed at several batch sizes, and reports the best ops/sec
+#   over a number of repeats along with the peak memory allocated during a
+#   separate run (tracing allocations slows the code down, so it is never
+#   enabled while timing). Results can be saved as a JSON baseline, and later
+#   runs compared against it to flag regressions.
+
+DEFAULT_SIZES = (10, 100, 1000)
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.2
+
+# Inputs are generated from a fixed seed so that runs are comparable
+def _random_RGB(rng, n):
+    return [colors.RGB(rng.randrange(256), rng.randrange(256),
+                       rng.randrange(256)) for _ in range(n)]
+def _random_OKLCH(rng, n, max_chroma=0.4):
+    return [colors.OKLCH(rng.random(), rng.random() * max_chroma,
+                         rng.random() * 360) for _ in range(n)]
+
+# Each benchmark is a function which takes the batch size and a random number
+#   generator, and returns a function to be timed
+def _bench_RGB_to_OKLAB(n, rng):
+    inputs = _random_RGB(rng, n)
+    return lambda: [c.to_OKLAB() for c in inputs]
+
+def _bench_OKLAB_to_RGB(n, rng):
+    inputs = [c.to_OKLAB() for c in _random_RGB(rng, n)]
+    return lambda: [c.to_RGB() for c in inputs]
+
+def _bench_HEX_to_OKLCH(n, rng):
+    inputs = [c.to_HEX() for c in _random_RGB(rng, n)]
+    return lambda: [c.to_OKLCH() for c in inputs]
+
+def _bench_find_cusp(n, rng):
+    inputs = [rng.random() * 360 for _ in range(n)]
+    return lambda: [tools.find_cusp(hue=h) for h in inputs]
+
+def _bench_find_gamut_intersection(method):
+    def bench(n, rng):
+        inputs = _random_OKLCH(rng, n)
+        return lambda: [tools._find_gamut_intersection(c.l, c.c, color=c,
+                                                       method=method)
+                        for c in inputs]
+    return bench
+
+def _bench_chromatize(n, rng):
+    inputs = [c.to_OKLCH() for c in _random_RGB(rng, n)]
+    return lambda: [tools.chromatize(0.5, c) for c in inputs]
+
+def _bench_lighten(n, rng):
+    inputs = [c.to_OKLCH() for c in _random_RGB(rng, n)]
+    return lambda: [tools.lighten(0.5, c) for c in inputs]
+
+def _bench_interpolate(method):
+    def bench(n, rng):
+        inputs = [(rng.random(), c1.to_OKLCH(), c2.to_OKLCH()) \
+                      for c1, c2 in zip(_random_RGB(rng, n),
+                                        _random_RGB(rng, n))]
+        return lambda: [tools.interpolate(t, c1, c2, method=method)
+                        for t, c1, c2 in inputs]
+    return bench
+
+def _bench_get_nearest_web_color(n, rng):
+    inputs = _random_RGB(rng, n)
+    return lambda: [colors.Color.get_nearest_web_color(c) for c in inputs]
+
+BENCHMARKS = {
+    'RGB.to_OKLAB': _bench_RGB_to_OKLAB,
+    'OKLAB.to_RGB': _bench_OKLAB_to_RGB,
+    'HEX.to_OKLCH': _bench_HEX_to_OKLCH,
+    'find_cusp': _bench_find_cusp,
+    '_find_gamut_intersection[hue_dependent]':
+        _bench_find_gamut_intersection('hue_dependent'),
+    '_find_gamut_intersection[hue_independent]':
+        _bench_find_gamut_intersection('hue_independent'),
+    '_find_gamut_intersection[preserve_lightness]':
+        _bench_find_gamut_intersection('preserve_lightness'),
+    'chromatize': _bench_chromatize,
+    'lighten': _bench_lighten,
+    'interpolate[shortest]': _bench_interpolate('shortest'),
+    'interpolate[longest]': _bench_interpolate('longest'),
+    'interpolate[increasing]': _bench_interpolate('increasing'),
+    'interpolate[decreasing]': _bench_interpolate('decreasing'),
+    'interpolate[use_OKLAB]': _bench_interpolate('use_OKLAB'),
+    'get_nearest_web_color': _bench_get_nearest_web_color,
+}
+
+# Times a single benchmark at a single batch size
+#
+# Every run is given freshly built inputs (from the same seed), and the cache in
+#   oklch.tools is emptied beforehand, so that memoized results (e.g. from
+#   colors.enable_conversion_cache() or tools.enable_cache()) are never timed
+#   in place of the work itself.
+def run_benchmark(name, n, repeat = DEFAULT_REPEAT, seed = 0):
+    def setup():
+        tools.cache_clear()
+        return BENCHMARKS[name](n, random.Random(seed))
+
+    # Warm up any lazily built state before timing
+    setup()()
+
+    best = float('inf')
+    for _ in range(repeat):
+        fn = setup()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    fn = setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'ops_per_sec': n / best if best > 0 else float('inf'),
+            'seconds': best,
+            'peak_memory': peak}
+
+# Runs every selected benchmark at every size, printing as it goes
+def run(names = None,
+        sizes = DEFAULT_SIZES,
+        repeat = DEFAULT_REPEAT,
+        seed = 0,
+        out = sys.stdout):
+
+    if names is None:
+        names = list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark: '{name}'!")
+
+    results = {}
+    for name in names:
+        results[name] = {}
+        for n in sizes:
+            result = run_benchmark(name, n, repeat, seed)
+            results[name][str(n)] = result
+            print("{:<46} n={:<7} {:>12.0f} ops/s {:>10.1f} KiB".format(
+                    name, n, result['ops_per_sec'],
+                    result['peak_memory'] / 1024), file=out)
+
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': list(sizes),
+            'repeat': repeat,
+            'seed': seed,
+            'results': results}
+
+# Compares results against a baseline, returning a list of descriptions of
+#   every benchmark whose ops/sec dropped by more than threshold
+def compare(results, baseline, threshold = DEFAULT_THRESHOLD):
+    regressions = []
+    for name, by_size in results['results'].items():
+        for n, result in by_size.items():
+            try:
+                old = baseline['results'][name][n]['ops_per_sec']
+            except KeyError:
+                continue
+            new = result['ops_per_sec']
+            if new < old * (1 - threshold):
+                regressions.append(
+                        f"{name} n={n}: {old:.0f} -> {new:.0f} ops/s" \
+                        + f" ({new / old - 1:+.0%})")
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m oklch.bench',
+            description="Benchmark the hot paths of the oklch module.")
+    parser.add_argument('names', nargs='*', metavar='NAME',
+            help="benchmarks to run (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=int,
+            default=list(DEFAULT_SIZES), metavar='N',
+            help="batch sizes to run each benchmark at")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+            help="number of timed runs per benchmark; the best is kept")
+    parser.add_argument('--seed', type=int, default=0,
+            help="seed for generating inputs")
+    parser.add_argument('--save', metavar='FILE',
+            help="save the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE',
+            help="compare the results against a JSON baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help="fractional slowdown counted as a regression")
+    parser.add_argument('--list', action='store_true',
+            help="list the available benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+
+    try:
+        results = run(args.names or None, args.sizes, args.repeat, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against" \
+                    + f" {args.compare}:")
+            for r in regressions:
+                print("  " + r)
+            return 1
+        print(f"\nNo regressions against {args.compare}.")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
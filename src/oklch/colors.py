@@ -1,10 +1,61 @@
 # vim:foldmethod=indent:foldlevel=1
 from .tools import find_cusp
+from .index import ColorIndex
 
+from bisect import bisect_right
 import math
 from random import choice
-from sys import maxsize
-import heapq
+
+# Lookup table used as a fast path for converting RGB to OKLAB; see lut.py
+_rgb_lut = None
+
+# Conversions can be cached on each color object, so that converting the same
+#   color to the same space again is free; see enable_conversion_cache() below.
+#   The cache is tied to the color's state (its components, and for RGB and HEX
+#   the lookup table in use), and is emptied whenever that changes. Each cached
+#   result also remembers its own state, and is converted afresh if it has been
+#   modified since.
+def _cached(convert):
+    key = convert.__name__
+
+    def wrapper(self):
+        state = self._state()
+        cache = self._cache
+        if cache is not None and cache[0] == state:
+            entry = cache[1].get(key)
+            if entry is not None and entry[0]._state() == entry[1]:
+                return entry[0]
+        else:
+            cache = (state, {})
+            _set_cache(self, cache)
+
+        ret = convert(self)
+        cache[1][key] = (ret, ret._state())
+        return ret
+
+    # Any arguments become part of the key
+    def wrapper_with_args(self, *args, **kwargs):
+        state = self._state()
+        cache = self._cache
+        entry_key = (key, args, tuple(kwargs.items())) \
+                        if args or kwargs else key
+        if cache is not None and cache[0] == state:
+            entry = cache[1].get(entry_key)
+            if entry is not None and entry[0]._state() == entry[1]:
+                return entry[0]
+        else:
+            cache = (state, {})
+            _set_cache(self, cache)
+
+        ret = convert(self, *args, **kwargs)
+        cache[1][entry_key] = (ret, ret._state())
+        return ret
+
+    if convert.__code__.co_argcount > 1:
+        wrapper_with_args.__name__ = key[1:]
+        return wrapper_with_args
+    wrapper.__name__ = key[1:]
+    return wrapper
 
 # Converts an int to a hex string
 def _hex(i):
@@ -33,8 +84,39 @@ def _floor(f, nDigits=0):
     f = math.floor(f * 10**nDigits) / 10.**nDigits
     return float(format(f, '.' + str(nDigits) + 'f'))
 
+# A dictionary which counts the changes made to it, so that whatever is built
+#   from it can cheaply tell whether it is out of date
+class _WebColorDict(dict):
+    __slots__ = ('version',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def _changed(method):
+        def wrapper(self, *args, **kwargs):
+            self.version += 1
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    __setitem__ = _changed(dict.__setitem__)
+    __delitem__ = _changed(dict.__delitem__)
+    __ior__ = _changed(dict.__ior__)
+    clear = _changed(dict.clear)
+    pop = _changed(dict.pop)
+    popitem = _changed(dict.popitem)
+    setdefault = _changed(dict.setdefault)
+    update = _changed(dict.update)
+    del _changed
+
 # The superclass is only used for type-checking and should not be used directly
 class Color: 
+    __slots__ = ('_cache',)
+
+    # The names of each subclass's components, in order
+    _components = ()
+
     # These return a dummy color just so to eliminate an annoying warning. 
     def to_RGB(self): 
         return RGB(0, 0, 0)
@@ -50,6 +132,37 @@ class Color:
 
     def __str__(self): return ""
 
+    # Returns the state which cached conversions depend on
+    def _state(self):
+        return ()
+    # Cached conversions are left out when pickling or copying
+    def __getstate__(self):
+        state = {c: getattr(self, c) for c in self._components}
+        state['_cache'] = None
+        return (None, state)
+
+    # Returns a tuple identifying the color's type and components, optionally
+    #   rounding each numeric component to the given number of digits. Colors
+    #   which are within rounding distance of each other then share a key. 
+    def key(self, digits=None):
+        values = tuple(getattr(self, c) for c in self._components)
+        if digits is not None:
+            values = tuple(round(v, digits) if isinstance(v, (float, int)) \
+                                else v for v in values)
+        return (self._base_type().__name__,) + values
+    # Gets the mutable class of the color
+    @classmethod
+    def _base_type(cls):
+        for c in cls.__mro__:
+            if c.__base__ is Color:
+                return c
+        return cls
+
+    # Returns an immutable, hashable copy of the color
+    def freeze(self):
+        return self._base_type()._frozen_type(
+                *(getattr(self, c) for c in self._components))
+
     # Checks that arg is color
     @staticmethod
     def _is_color(arg):
@@ -85,7 +198,7 @@ class Color:
                             + (self.b - other.b) ** 2,
                         0.5)
 
-    ColorDict = { \
+    ColorDict = _WebColorDict({ \
         'MediumVioletRed':      '#C71585',
         'DeepPink':             '#FF1493',
         'PaleVioletRed':        '#DB7093',
@@ -226,7 +339,7 @@ class Color:
         'Silver':               '#C0C0C0',
         'LightGray':            '#D3D3D3',
         'Gainsboro':            '#DCDCDC'
-    }
+    })
 
     @staticmethod
     def get_web_color(color_name):
@@ -244,25 +357,36 @@ class Color:
                                 + f" received '{type(n)}'!")
         color = color.to_OKLCH()
 
-        # When n == 1, we can get the result faster by skipping the heap
-        if n == 1:
-            ret = (maxsize, None, None)
-            for k, v in Color.ColorDict.items():
-                c = HEX(v).to_OKLCH()
-                ret = min(ret, (color | c, k, c))
-            return (ret[1], ret[2])
+        ret = [(name, c) for name, c, _ in \
+                    Color._get_web_color_index().nearest(color, n)]
+        return ret[0] if n == 1 else ret
+
+    # The index of web colors is built on first use, and rebuilt if ColorDict
+    #   has been modified or replaced since. Rather than comparing the whole
+    #   dictionary on every query, ColorDict counts its own changes, so only
+    #   that count and the dictionary's identity are checked. Should ColorDict
+    #   be replaced with a plain dict, which doesn't count its changes, the
+    #   index falls back to comparing it against a copy.
+    _web_color_index = None
+    _web_color_index_source = None
+    _web_color_index_version = None
+    @staticmethod
+    def _get_web_color_index():
+        color_dict = Color.ColorDict
+        version = getattr(color_dict, 'version', None)
+        if version is None:
+            stale = Color._web_color_index_source != color_dict
         else:
-            # Build minheap of the web colors by distance
-            heap = []
-            for k, v in Color.ColorDict.items():
-                c = HEX(v).to_OKLCH()
-                heapq.heappush(heap, (color | c, k, c))
-
-            ret = []
-            for _ in range(n):
-                t = heapq.heappop(heap)
-                ret.append((t[1], t[2]))
-            return ret
+            stale = Color._web_color_index_source is not color_dict \
+                        or Color._web_color_index_version != version
+
+        if stale or Color._web_color_index is None:
+            Color._web_color_index = ColorIndex(
+                    {k: HEX(v).to_OKLCH() for k, v in color_dict.items()})
+            Color._web_color_index_source = \
+                    color_dict if version is not None else dict(color_dict)
+            Color._web_color_index_version = version
+        return Color._web_color_index
 
 ###############################################################################
 #
@@ -294,16 +418,27 @@ class Color:
 #
 ###############################################################################
 
+# Sets a color's cache directly, since frozen colors don't allow setting
+#   attributes
+_set_cache = Color._cache.__set__
+
 # RGB colors represented as triplets
 class RGB(Color):
+    __slots__ = ('r', 'g', 'b')
+    _components = ('r', 'g', 'b')
+
     def __init__(self, r, g, b):
         self.r = r
         self.g = g
         self.b = b
+        self._cache = None
 
     def __str__(self):
         return "rgb({}, {}, {})".format(self.r, self.g, self.b)
 
+    def _state(self):
+        return (self.r, self.g, self.b, _rgb_lut)
+
     def is_close(self, other):
         return super().is_close(other)
     # Return type for addition and subtraction is type of first operand
@@ -320,11 +455,12 @@ class RGB(Color):
     # Type Conversions
     def to_RGB(self):
         return self
-    def to_HEX(self):
+    def _to_HEX(self):
         return HEX("#{:0>2}{:0>2}{:0>2}".format(
                 _hex(self.r),
                 _hex(self.g),
                 _hex(self.b)))
+    to_HEX = _to_HEX
 
     # Functions for converting to linear RGB from standard RGB and vice versa
     @staticmethod
@@ -340,16 +476,19 @@ class RGB(Color):
         else:
             return x / 12.92
 
-    def to_OKLAB(self):
-        l = 0.4122214708 * self._srgb_transfer_function_inv(self.r/255) \
-                + 0.5363325363 * self._srgb_transfer_function_inv(self.g/255) \
-                + 0.0514459929 * self._srgb_transfer_function_inv(self.b/255)
-        m = 0.2119034982 * self._srgb_transfer_function_inv(self.r/255) \
-                + 0.6806995451 * self._srgb_transfer_function_inv(self.g/255) \
-                + 0.1073969566 * self._srgb_transfer_function_inv(self.b/255)
-        s = 0.0883024619 * self._srgb_transfer_function_inv(self.r/255) \
-                + 0.2817188376 * self._srgb_transfer_function_inv(self.g/255) \
-                + 0.6299787005 * self._srgb_transfer_function_inv(self.b/255)
+    def _to_OKLAB(self, use_lut=True):
+        if use_lut and _rgb_lut is not None:
+            lab = _rgb_lut.lookup(self.r, self.g, self.b)
+            if lab is not None:
+                return OKLAB(*lab)
+
+        r = _linearize(self.r)
+        g = _linearize(self.g)
+        b = _linearize(self.b)
+
+        l = 0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b
+        m = 0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b
+        s = 0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b
 
         l_ = math.pow(l, 1/3)
         m_ = math.pow(m, 1/3)
@@ -359,24 +498,111 @@ class RGB(Color):
             0.2104542553*l_ + 0.7936177850*m_ - 0.0040720468*s_,
             1.9779984951*l_ - 2.4285922050*m_ + 0.4505937099*s_,
             0.0259040371*l_ + 0.7827717662*m_ - 0.8086757660*s_)
-    def to_OKLCH(self):
-        return self.to_OKLAB().to_OKLCH()
+    to_OKLAB = _to_OKLAB
+    # With conversion caching on, chained conversions cache each intermediate
+    #   step on this color, rather than on the intermediate color objects
+    def _to_OKLCH(self):
+        return self.to_OKLAB()._to_OKLCH()
+    to_OKLCH = _to_OKLCH
 
     # Check whether the color is in-gamut
     def is_in_gamut(self):
         return max(self.r, self.g, self.b) <= 255 and \
                 min(self.r, self.g, self.b) >= 0
 
+# The sRGB transfer functions are the most expensive part of converting to and
+#   from RGB, but 8-bit channels only have 256 possible values, so they are
+#   tabulated here:
+#   - _LINEAR_FROM_SRGB8[i] is the linear value of channel value i
+#   - _SRGB8_THRESHOLDS[k - 1] is the smallest linear value which rounds to
+#       channel value k, found exactly so that encoding by bisection gives
+#       precisely the same result as _round(_srgb_transfer_function(x) * 255)
+# Values outside of the tables' ranges fall back to the transfer functions. 
+_LINEAR_FROM_SRGB8 = [RGB._srgb_transfer_function_inv(i / 255) \
+                          for i in range(256)]
+
+def _find_srgb8_threshold(k, start=None):
+    def rounds_to_k(x):
+        return _round(RGB._srgb_transfer_function(x) * 255) >= k
+
+    # Start from the analytic threshold, then step to the exact float
+    x = RGB._srgb_transfer_function_inv((k - 0.5) / 255) \
+            if start is None else start
+    if rounds_to_k(x):
+        while rounds_to_k(math.nextafter(x, -math.inf)):
+            x = math.nextafter(x, -math.inf)
+    else:
+        while not rounds_to_k(x):
+            x = math.nextafter(x, math.inf)
+    return x
+_SRGB8_THRESHOLDS = [_find_srgb8_threshold(k) for k in range(1, 256)]
+
+# Likewise, the range of linear values which round into [0,255]. Since _round()
+#   truncates negative values towards zero, anything above -1 rounds to 0. 
+_SRGB8_MIN = _find_srgb8_threshold(0, start=-1 / 255 / 12.92)
+_SRGB8_MAX = _find_srgb8_threshold(256)
+
+# Converts an sRGB channel in [0,255] to linear RGB
+def _linearize(x):
+    if type(x) is int and 0 <= x <= 255:
+        return _LINEAR_FROM_SRGB8[x]
+    return RGB._srgb_transfer_function_inv(x / 255)
+
+# Converts a linear RGB channel to a rounded sRGB channel in [0,255]
+def _encode(x):
+    if 0. <= x <= 1.:
+        return bisect_right(_SRGB8_THRESHOLDS, x)
+    return _round(RGB._srgb_transfer_function(x) * 255)
+
+# Checks whether an OKLAB color is in gamut by converting it only as far as
+#   linear RGB. By default, this matches to_RGB().is_in_gamut() exactly, i.e. a
+#   color is in gamut if it rounds into [0,255]; if epsilon is given, each
+#   linear channel must instead be within [-epsilon, 1 + epsilon]. 
+def _is_in_gamut(L, a, b, epsilon=None):
+    l_ = L + 0.3963377774 * a + 0.2158037573 * b
+    m_ = L - 0.1055613458 * a - 0.0638541728 * b
+    s_ = L - 0.0894841775 * a - 1.2914855480 * b
+
+    l = l_*l_*l_
+    m = m_*m_*m_
+    s = s_*s_*s_
+
+    if epsilon is None:
+        lo = _SRGB8_MIN
+        hi = _SRGB8_MAX
+        return lo <= +4.0767416621 * l - 3.3077115913 * m \
+                        + 0.2309699292 * s < hi \
+            and lo <= -1.2684380046 * l + 2.6097574011 * m \
+                        - 0.3413193965 * s < hi \
+            and lo <= -0.0041960863 * l - 0.7034186147 * m \
+                        + 1.7076147010 * s < hi
+
+    lo = -epsilon
+    hi = 1 + epsilon
+    return lo <= +4.0767416621 * l - 3.3077115913 * m \
+                    + 0.2309699292 * s <= hi \
+        and lo <= -1.2684380046 * l + 2.6097574011 * m \
+                    - 0.3413193965 * s <= hi \
+        and lo <= -0.0041960863 * l - 0.7034186147 * m \
+                    + 1.7076147010 * s <= hi
+
 # RGB colors represented as hex code
 class HEX(Color):
+    __slots__ = ('hex_code',)
+    _components = ('hex_code',)
+
     def __init__(self, hex_code):
         if not hex_code[0] == '#':
             hex_code = '#' + hex_code
         self.hex_code = hex_code.upper()
+        self._cache = None
 
     def __str__(self):
         return self.hex_code
 
+    def _state(self):
+        return (self.hex_code, _rgb_lut)
+
     def is_close(self, other):
         return super().is_close(other)
     # Return type for addition and subtraction is type of first operand, unless
@@ -399,17 +625,20 @@ class HEX(Color):
         return super().__or__(other)
 
     # Type Conversions
-    def to_RGB(self):
+    def _to_RGB(self):
         return RGB(
             int(self.hex_code[1:3], 16),
             int(self.hex_code[3:5], 16),
             int(self.hex_code[5:7], 16))
+    to_RGB = _to_RGB
     def to_HEX(self):
         return self
-    def to_OKLAB(self):
-        return self.to_RGB().to_OKLAB()
-    def to_OKLCH(self):
-        return self.to_RGB().to_OKLCH()
+    def _to_OKLAB(self):
+        return self.to_RGB()._to_OKLAB()
+    to_OKLAB = _to_OKLAB
+    def _to_OKLCH(self):
+        return self.to_OKLAB()._to_OKLCH()
+    to_OKLCH = _to_OKLCH
 
     # Check whether the color is in-gamut
     def is_in_gamut(self):
@@ -417,14 +646,21 @@ class HEX(Color):
 
 # OKLAB colors represented as triplets
 class OKLAB(Color):
+    __slots__ = ('l', 'a', 'b')
+    _components = ('l', 'a', 'b')
+
     def __init__(self, l, a, b):
         self.l = l
         self.a = a
         self.b = b
+        self._cache = None
 
     def __str__(self):
         return f"oklab({self.l}, {self.a}, {self.b})"
 
+    def _state(self):
+        return (self.l, self.a, self.b)
+
     def is_close(self, other):
         return super().is_close(other)
     # Return type for addition and subtraction is type of first operand
@@ -443,7 +679,7 @@ class OKLAB(Color):
         return super().__or__(other)
 
     # Type Conversions
-    def to_RGB(self):
+    def _to_RGB(self):
         l_ = self.l + 0.3963377774 * self.a + 0.2158037573 * self.b
         m_ = self.l - 0.1055613458 * self.a - 0.0638541728 * self.b
         s_ = self.l - 0.0894841775 * self.a - 1.2914855480 * self.b
@@ -453,40 +689,51 @@ class OKLAB(Color):
         s = s_*s_*s_
 
         return RGB(
-            _round(RGB._srgb_transfer_function(+4.0767416621 * l \
+            _encode(+4.0767416621 * l \
                     - 3.3077115913 * m \
-                    + 0.2309699292 * s) * 255),
-            _round(RGB._srgb_transfer_function(-1.2684380046 * l \
+                    + 0.2309699292 * s),
+            _encode(-1.2684380046 * l \
                     + 2.6097574011 * m \
-                    - 0.3413193965 * s) * 255),
-            _round(RGB._srgb_transfer_function(-0.0041960863 * l \
+                    - 0.3413193965 * s),
+            _encode(-0.0041960863 * l \
                     - 0.7034186147 * m \
-                    + 1.7076147010 * s) * 255))
-    def to_HEX(self):
-        return self.to_RGB().to_HEX()
+                    + 1.7076147010 * s))
+    to_RGB = _to_RGB
+    def _to_HEX(self):
+        return self.to_RGB()._to_HEX()
+    to_HEX = _to_HEX
     def to_OKLAB(self):
         return self
-    def to_OKLCH(self):
+    def _to_OKLCH(self):
         c = math.pow(self.a ** 2 + self.b ** 2, 0.5)
         h = math.degrees(math.atan2(self.b, self.a))
         if h < 0:
             h += 360
 
         return OKLCH(self.l, c, h)
+    to_OKLCH = _to_OKLCH
 
+    # Check whether the color is in-gamut
     def is_in_gamut(self):
-        return super().is_in_gamut()
+        return _is_in_gamut(self.l, self.a, self.b)
 
 # OKLCH colors represented as triplets
 class OKLCH(Color):
+    __slots__ = ('l', 'c', 'h')
+    _components = ('l', 'c', 'h')
+
     def __init__(self, l, c, h):
         self.l = l
         self.c = c
         self.h = h
+        self._cache = None
 
     def __str__(self):
         return "oklch({}, {}, {})".format(self.l, self.c, self.h)
 
+    def _state(self):
+        return (self.l, self.c, self.h)
+
     def is_close(self, other):
         return super().is_close(other)
     # Return type for addition and subtraction is type of first operand
@@ -501,10 +748,12 @@ class OKLCH(Color):
         return super().__or__(other)
 
     # Type Conversions
-    def to_RGB(self):
-        return self.to_OKLAB().to_RGB()
-    def to_HEX(self):
-        return self.to_RGB().to_HEX()
+    def _to_RGB(self):
+        return self.to_OKLAB()._to_RGB()
+    to_RGB = _to_RGB
+    def _to_HEX(self):
+        return self.to_RGB()._to_HEX()
+    to_HEX = _to_HEX
 
     @staticmethod
     def _get_normalized_ab(hue):
@@ -512,16 +761,18 @@ class OKLCH(Color):
         b = math.sin(math.radians(hue))
 
         return a, b
-    def to_OKLAB(self):
+    def _to_OKLAB(self):
         a, b = self._get_normalized_ab(self.h)
 
         return OKLAB(self.l, a * self.c, b * self.c)
+    to_OKLAB = _to_OKLAB
     def to_OKLCH(self):
         return self
 
     # Check whether the color is in-gamut
     def is_in_gamut(self):
-        return super().is_in_gamut()
+        a, b = self._get_normalized_ab(self.h)
+        return _is_in_gamut(self.l, a * self.c, b * self.c)
 
     # Returns a css string which rounds in such a way as to guarantee an
     #   in-gamut color (presuming the original color was in-gamut, of course)
@@ -538,3 +789,97 @@ class OKLCH(Color):
 
         # Doesn't matter how h is rounded; it can go directly in format string
         return "oklch({:.2%} {:.3f} {:.2f})".format(l, c, self.h)
+
+# Frozen colors are immutable versions of the above, and can therefore be
+#   compared by value and used as dictionary keys or set members. Two frozen
+#   colors are equal if they are of the same color space and have exactly equal
+#   components; to compare with a tolerance, use key(digits) instead. 
+class _Frozen:
+    __slots__ = ()
+
+    # Components are normalized by the mutable class, then copied over
+    def __init__(self, *args):
+        color = self._base_type()(*args)
+        for c in self._components:
+            object.__setattr__(self, c, getattr(color, c))
+        object.__setattr__(self, '_cache', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable!")
+    def __delattr__(self, name):
+        raise AttributeError(f"'{type(self).__name__}' object is immutable!")
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, c) for c in self._components))
+
+    # Mutable colors are compared (and hashed) by identity, so a frozen color is
+    #   never equal to one, even with the same components; otherwise a mix of
+    #   the two in a set or dictionary would misbehave
+    def __eq__(self, other):
+        if not isinstance(other, _Frozen):
+            return NotImplemented
+        return self.key() == other.key()
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        return ret if ret is NotImplemented else not ret
+    def __hash__(self):
+        return hash(self.key())
+
+    def freeze(self):
+        return self
+
+class FrozenRGB(_Frozen, RGB):
+    __slots__ = ()
+class FrozenHEX(_Frozen, HEX):
+    __slots__ = ()
+class FrozenOKLAB(_Frozen, OKLAB):
+    __slots__ = ()
+class FrozenOKLCH(_Frozen, OKLCH):
+    __slots__ = ()
+
+RGB._frozen_type = FrozenRGB
+HEX._frozen_type = FrozenHEX
+OKLAB._frozen_type = FrozenOKLAB
+OKLCH._frozen_type = FrozenOKLCH
+
+###############################################################################
+#
+# Conversion caching
+#
+# Caching conversions is disabled by default, since it costs both time and
+#   memory for colors which are only converted once, which is the usual case
+#   (e.g. for a stream of pixels). Where the same colors are converted over and
+#   over, such as a theme rendered as HEX, RGB, and CSS strings, it is turned on
+#   with enable_conversion_cache().
+#
+# Rather than checking a flag on every conversion, enabling the cache replaces
+#   each class's to_*() methods with caching versions of its _to_*() methods,
+#   and disabling it puts the plain ones back, so there is no cost at all while
+#   it is off. Caches already made are kept on their colors until they change,
+#   but are not used while it is off.
+#
+###############################################################################
+_CONVERSIONS = ('to_RGB', 'to_HEX', 'to_OKLAB', 'to_OKLCH')
+_cache_conversions = False
+
+# Installs the caching or plain conversions on every class, as set by
+#   _cache_conversions
+def _install_conversions():
+    for cls in (RGB, HEX, OKLAB, OKLCH):
+        for name in _CONVERSIONS:
+            convert = vars(cls).get('_' + name)
+            if convert is not None:
+                setattr(cls, name,
+                        _cached(convert) if _cache_conversions else convert)
+
+def enable_conversion_cache():
+    global _cache_conversions
+    _cache_conversions = True
+    _install_conversions()
+
+def disable_conversion_cache():
+    global _cache_conversions
+    _cache_conversions = False
+    _install_conversions()
+
+def is_conversion_cache_enabled():
+    return _cache_conversions
@@ -0,0 +1,332 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from . import tools
+
+import math
+import re
+
+# Parsing and serializing CSS colors, and rewriting every color in a stylesheet.
+#   The following forms are recognized (case-insensitively):
+#   - hex codes with 3, 4, 6, or 8 digits
+#   - rgb() and rgba(), with either commas between every channel and the
+#       alpha (the legacy syntax) or spaces between the channels and a '/'
+#       before the alpha, but never a mix of the two
+#   - oklab() and oklch()
+#   - the named colors in Color.ColorDict
+#   Any alpha value is parsed and carried through, though the color objects
+#   themselves have no alpha.
+#
+# Stylesheets are tokenized in a single pass with one regular expression.
+#   Colors are only recognized in declaration values, i.e. after a ':' in a
+#   segment ending with ';' or '}', so that selectors such as #fab or .red are
+#   left alone, as are comments, strings, and url()s.
+
+_NUMBER = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?'
+_NUMBER_OR_PERCENT = _NUMBER + r'%?'
+_ALPHA = rf'(?:\s*[,/]\s*({_NUMBER_OR_PERCENT}))?'
+
+_COLOR = rf'''
+    (?P<hex>\#([0-9a-f]{{8}}|[0-9a-f]{{6}}|[0-9a-f]{{3,4}})(?![\w-]))
+  | (?P<rgb>rgba?\(\s*(?:
+        ({_NUMBER_OR_PERCENT})\s*,\s*({_NUMBER_OR_PERCENT})\s*,\s*
+            ({_NUMBER_OR_PERCENT})(?:\s*,\s*({_NUMBER_OR_PERCENT}))?
+      | ({_NUMBER_OR_PERCENT})\s+({_NUMBER_OR_PERCENT})\s+
+            ({_NUMBER_OR_PERCENT})(?:\s*/\s*({_NUMBER_OR_PERCENT}))?
+        )\s*\))
+  | (?P<oklab>oklab\(\s*({_NUMBER_OR_PERCENT})\s+({_NUMBER_OR_PERCENT})
+        \s+({_NUMBER_OR_PERCENT}){_ALPHA}\s*\))
+  | (?P<oklch>oklch\(\s*({_NUMBER_OR_PERCENT})\s+({_NUMBER_OR_PERCENT})
+        \s+({_NUMBER})(deg|rad|grad|turn)?{_ALPHA}\s*\))
+'''
+
+# The names are grouped by their first letter, which is much faster to match
+#   than trying every name in turn
+_NAMED_COLOR = r'''
+  | (?P<name>(?<![\w.\#@$-])(?:{})(?![\w(-]))
+'''
+
+# Comments, strings, and url()s are matched whole so that nothing inside them
+#   is mistaken for a color; 'open' catches any which are cut off at the end of
+#   a chunk.
+_STRUCTURE = r'''
+    (?P<comment>/\*.*?\*/)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<url>url\([^)]*\))
+  | (?P<open>/\*|["']|url\()
+  | (?P<delim>[{};])
+  | (?P<colon>:)
+  |
+'''
+
+_FLAGS = re.IGNORECASE | re.VERBOSE | re.DOTALL
+# Every token starts with one of a few characters, so other positions are
+#   skipped before trying each alternative
+_START = r'(?=[/"\'u{{}};:\#ro{}])(?:'
+_TOKENS_UNNAMED = re.compile(_START.format('') + _STRUCTURE + _COLOR + ')',
+                             _FLAGS)
+
+# The patterns which match named colors are built from Color.ColorDict on first
+#   use, and rebuilt if it has changed since, as with the web color index in
+#   colors. They are held as a tuple of the names (lowercased, mapped to their
+#   hex codes), the pattern for a single color, and the pattern for tokens.
+_named = None
+_named_source = None
+_named_version = None
+def _get_named():
+    global _named, _named_source, _named_version
+    color_dict = colors.Color.ColorDict
+    version = getattr(color_dict, 'version', None)
+    if version is None:
+        stale = _named_source != color_dict
+    else:
+        stale = _named_source is not color_dict or _named_version != version
+
+    if stale or _named is None:
+        names = {name.lower(): code for name, code in color_dict.items()}
+        firsts = sorted({n[0] for n in names})
+        named_color = _NAMED_COLOR.format('|'.join(
+                re.escape(first) + '(?:' \
+                    + '|'.join(re.escape(n[1:]) for n in names \
+                                   if n[0] == first) + ')'
+                for first in firsts)) if names else ''
+        single = re.compile(rf'\s*(?:{_COLOR}{named_color})\s*', _FLAGS)
+        tokens = re.compile(_START.format(re.escape(''.join(firsts))) \
+                                + _STRUCTURE + _COLOR + named_color + ')',
+                            _FLAGS)
+        _named = (names, single, tokens)
+        _named_source = color_dict if version is not None else dict(color_dict)
+        _named_version = version
+    return _named
+
+_KINDS = ('hex', 'rgb', 'oklab', 'oklch', 'name')
+_SPACES = {'hex': 'HEX', 'name': 'HEX', 'rgb': 'RGB',
+           'oklab': 'OKLAB', 'oklch': 'OKLCH'}
+
+# Parses a number, where a percentage is a fraction of scale
+def _number(s, scale = 1):
+    if s.endswith('%'):
+        return float(s[:-1]) / 100 * scale
+    return float(s)
+
+# Channels are rounded and clamped to 8-bit ints, as CSS does and as RGB
+#   expects, so percentages and fractions can still be written as hex codes
+def _channel(s):
+    return min(255, max(0, colors._round(_number(s, 255))))
+
+def _alpha(s):
+    if s is None:
+        return None
+    return min(1., max(0., _number(s)))
+
+# Gets the color and alpha of a match of any of the patterns above
+def _from_match(m):
+    kind = m.lastgroup
+    groups = m.groups()
+    # The groups of the matched alternative follow its named group
+    g = groups[m.re.groupindex[kind]:]
+
+    if kind == 'hex':
+        digits = g[0]
+        if len(digits) <= 4:
+            digits = ''.join(d * 2 for d in digits)
+        alpha = int(digits[6:8], 16) / 255 if len(digits) == 8 else None
+        return colors.HEX('#' + digits[:6]), alpha
+
+    if kind == 'rgb':
+        # The legacy (comma-separated) syntax is matched first
+        if g[0] is None:
+            g = g[4:]
+        return colors.RGB(_channel(g[0]), _channel(g[1]), _channel(g[2])), \
+                _alpha(g[3])
+
+    if kind == 'oklab':
+        return colors.OKLAB(_number(g[0]), _number(g[1], 0.4),
+                            _number(g[2], 0.4)), _alpha(g[3])
+
+    if kind == 'oklch':
+        h = float(g[2])
+        unit = (g[3] or 'deg').lower()
+        if unit == 'rad':
+            h = math.degrees(h)
+        elif unit == 'grad':
+            h *= 0.9
+        elif unit == 'turn':
+            h *= 360
+        return colors.OKLCH(_number(g[0]), _number(g[1], 0.4), h % 360), \
+                _alpha(g[4])
+
+    return colors.HEX(_get_named()[0][m.group(kind).lower()]), None
+
+# Parses a single CSS color, returning a color object of the matching type
+#   (HEX for hex codes and named colors), or a tuple of the color and its alpha
+#   (None if not given) if alpha is True
+def parse(text, alpha = False):
+    m = _get_named()[1].fullmatch(text)
+    if m is None:
+        raise ValueError(f"Expected a CSS color, received '{text}'!")
+    color, a = _from_match(m)
+    return (color, a) if alpha else color
+
+# Formats a number with at most the given number of decimal places
+def _format(x, digits):
+    if isinstance(x, int):
+        return str(x)
+    s = f"{x:.{digits}f}"
+    if '.' in s:
+        s = s.rstrip('0').rstrip('.')
+    return '0' if s == '-0' else s
+
+# Serializes a color as a CSS color in the given space ('HEX', 'RGB', 'OKLAB',
+#   or 'OKLCH'), or in its own space by default. Out-of-gamut colors are clipped
+#   with gamut_clip_preserve_lightness() for HEX and RGB, which can't represent
+#   them; OKLCH colors are written with OKLCH.css_string().
+def serialize(color, space = None, alpha = None):
+    colors.Color._is_color(color)
+    if space is None:
+        space = type(color)._base_type().__name__
+    if space not in _SPACES.values():
+        raise ValueError(f"""Unknown space: '{space}'!
+Valid spaces are 'HEX', 'RGB', 'OKLAB', and 'OKLCH'.""")
+
+    if space in ('HEX', 'RGB') and not color.is_in_gamut():
+        color = tools.gamut_clip_preserve_lightness(color)
+    suffix = '' if alpha is None else f" / {_format(alpha, 3)}"
+
+    if space == 'HEX':
+        ret = color.to_HEX().hex_code
+        if alpha is not None:
+            ret += f"{colors._round(alpha * 255):0>2X}"
+        return ret
+    if space == 'RGB':
+        rgb = color.to_RGB()
+        return f"rgb({_format(rgb.r, 3)} {_format(rgb.g, 3)}" \
+                + f" {_format(rgb.b, 3)}{suffix})"
+    if space == 'OKLAB':
+        lab = color.to_OKLAB()
+        return f"oklab({_format(lab.l * 100, 2)}% {_format(lab.a, 4)}" \
+                + f" {_format(lab.b, 4)}{suffix})"
+    return color.to_OKLCH().css_string()[:-1] + suffix + ')'
+
+# Scans text for colors in declaration values, returning a list of the matches
+#   and the index up to which the text was fully scanned. Unless final, the
+#   text may be cut off mid-declaration, so scanning stops after the last
+#   complete declaration.
+def _scan(text, final, named):
+    pattern = _get_named()[2] if named else _TOKENS_UNNAMED
+    found = []
+    pending = []
+    in_value = False
+    done = 0
+
+    for m in pattern.finditer(text):
+        kind = m.lastgroup
+        if kind == 'open':
+            # A comment, string, or url() continues past the end of the text
+            if not final:
+                return found, done
+            break
+        elif kind == 'delim':
+            # Anything before an opening brace was a selector or at-rule
+            if m.group() != '{':
+                found.extend(pending)
+            pending = []
+            in_value = False
+            done = m.end()
+        elif kind == 'colon':
+            in_value = True
+        elif kind in _KINDS and in_value:
+            pending.append(m)
+
+    if final:
+        found.extend(pending)
+        done = len(text)
+    return found, done
+
+# Finds every color in a stylesheet's declaration values, as a list of
+#   (start, end, color, alpha) tuples
+def find_colors(css, named = False):
+    return [(m.start(), m.end()) + _from_match(m) \
+                for m in _scan(css, True, named)[0]]
+
+# Rewrites every color in a stylesheet. Each color is passed to op, if given,
+#   and the result is serialized in the given space, or in the space it was
+#   written in (HEX for named colors). Stylesheets usually repeat the same
+#   colors many times over, so the rewrite of each distinct color value is
+#   remembered and reused; this memo is emptied whenever it grows past
+#   max_cache entries to keep memory bounded.
+class Rewriter:
+    def __init__(self, op = None, space = None, named = False,
+                 max_cache = 1 << 16):
+        if op is not None and not callable(op):
+            raise ValueError(f"Expected callable, received '{type(op)}'!")
+        if space is not None and space not in _SPACES.values():
+            raise ValueError(f"""Unknown space: '{space}'!
+Valid spaces are 'HEX', 'RGB', 'OKLAB', and 'OKLCH'.""")
+        if not (isinstance(max_cache, int) and max_cache >= 0):
+            raise ValueError("Expected a non-negative integer, received" \
+                                + f" '{max_cache}'!")
+
+        self.op = op
+        self.space = space
+        self.named = named
+        self.max_cache = max_cache
+        self._cache = {}
+
+    # Gets the rewrite of a single matched color
+    def _replace(self, m):
+        text = m.group()
+        try:
+            return self._cache[text]
+        except KeyError:
+            pass
+
+        color, alpha = _from_match(m)
+        if self.op is not None:
+            color = self.op(color)
+        ret = serialize(color, self.space or _SPACES[m.lastgroup], alpha)
+
+        if len(self._cache) >= self.max_cache:
+            self._cache.clear()
+        self._cache[text] = ret
+        return ret
+
+    # Rewrites the scanned part of text, returning it along with the index up
+    #   to which the text was scanned
+    def _rewrite(self, text, final):
+        found, done = _scan(text, final, self.named)
+        out = []
+        last = 0
+        for m in found:
+            out.append(text[last:m.start()])
+            out.append(self._replace(m))
+            last = m.end()
+        out.append(text[last:done])
+        return ''.join(out), done
+
+    # Rewrites a whole stylesheet held as a string
+    def rewrite(self, css):
+        return self._rewrite(css, True)[0]
+
+    # Rewrites a stylesheet from one text file object to another, reading it in
+    #   chunks so that the memory used does not depend on its size. Returns the
+    #   number of characters written.
+    def rewrite_stream(self, src, dst, chunk_size = 1 << 16):
+        if not (isinstance(chunk_size, int) and chunk_size > 0):
+            raise ValueError("Expected a positive integer, received" \
+                                + f" '{chunk_size}'!")
+
+        n = 0
+        carry = ''
+        while True:
+            chunk = src.read(chunk_size)
+            text = carry + chunk
+            out, done = self._rewrite(text, not chunk)
+            dst.write(out)
+            n += len(out)
+            carry = text[done:]
+            if not chunk:
+                return n
+
+# Rewrites every color in a stylesheet held as a string; see Rewriter
+def rewrite(css, op = None, space = None, named = False):
+    return Rewriter(op, space, named).rewrite(css)
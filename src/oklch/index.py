@@ -0,0 +1,292 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+
+import heapq
+import math
+
+# A k-d tree over the OKLAB coordinates of a set of named colors, used to find
+#   the nearest colors to a query without comparing against every entry. The
+#   tree is built once when the index is created, after which each query only
+#   visits the branches which could still hold a closer color.
+#
+# Distances are the same euclidean OKLAB distances given by the pipe operator,
+#   and ties in distance are broken by name so that results are deterministic.
+class ColorIndex:
+    # Entries may be given either as a dictionary of {name: color} or as a
+    #   sequence of colors, in which case each color is named by its position.
+    #   Colors may be color objects or hex code strings.
+    def __init__(self, entries):
+        if isinstance(entries, dict):
+            items = list(entries.items())
+        else:
+            items = list(enumerate(entries))
+
+        self.names = []
+        self.colors = []
+        self._points = []
+        for name, color in items:
+            if isinstance(color, str):
+                color = colors.HEX(color)
+            colors.Color._is_color(color)
+            lab = color.to_OKLAB()
+
+            self.names.append(name)
+            self.colors.append(color)
+            self._points.append((lab.l, lab.a, lab.b))
+
+        # Rank each entry by name for breaking ties, falling back to insertion
+        #   order if the names cannot be compared
+        order = range(len(items))
+        try:
+            order = sorted(order, key=lambda i: self.names[i])
+        except TypeError:
+            pass
+        self._rank = [0] * len(items)
+        for rank, i in enumerate(order):
+            self._rank[i] = rank
+
+        # Each node is stored as (entry, axis, left, right), where the children
+        #   are node indices or -1
+        self._nodes = []
+        self._root = self._build(list(range(len(items))), 0)
+
+    def _build(self, entries, depth):
+        if not entries:
+            return -1
+
+        axis = depth % 3
+        entries.sort(key=lambda i: self._points[i][axis])
+        mid = len(entries) // 2
+
+        node = len(self._nodes)
+        self._nodes.append(None)
+        left = self._build(entries[:mid], depth + 1)
+        right = self._build(entries[mid + 1:], depth + 1)
+        self._nodes[node] = (entries[mid], axis, left, right)
+
+        return node
+
+    def __len__(self):
+        return len(self.names)
+
+    # Checks the query and converts it to an OKLAB triplet
+    @staticmethod
+    def _get_point(color):
+        colors.Color._is_color(color)
+        lab = color.to_OKLAB()
+        return (lab.l, lab.a, lab.b)
+
+    def _squared_distance(self, point, i):
+        other = self._points[i]
+        return (point[0] - other[0]) ** 2 \
+                + (point[1] - other[1]) ** 2 \
+                + (point[2] - other[2]) ** 2
+
+    # Builds the result list from (squared distance, entry) pairs
+    def _results(self, found):
+        found.sort(key=lambda x: (x[0], self._rank[x[1]]))
+        return [(self.names[i], self.colors[i], math.pow(d2, 0.5)) \
+                    for d2, i in found]
+
+    # Returns a list of the k nearest entries to color as tuples of
+    #   (name, color, distance), sorted by distance
+    def nearest(self, color, k=1):
+        if not (isinstance(k, int) and k > 0):
+            raise ValueError("Expected a positive integer," \
+                                + f" received '{type(k)}'!")
+        point = self._get_point(color)
+
+        # Max-heap of the best entries found so far as (-d2, -rank, entry)
+        heap = []
+
+        def search(node):
+            if node < 0:
+                return
+            i, axis, left, right = self._nodes[node]
+
+            d2 = self._squared_distance(point, i)
+            item = (-d2, -self._rank[i], i)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+            diff = point[axis] - self._points[i][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            # Ties are kept, so the far side is searched even when it could
+            #   only hold entries at exactly the current worst distance
+            if len(heap) < k or diff * diff <= -heap[0][0]:
+                search(far)
+
+        search(self._root)
+        return self._results([(-d2, i) for d2, _, i in heap])
+
+    # Returns a list of every entry within radius of color as tuples of
+    #   (name, color, distance), sorted by distance
+    def within(self, color, radius):
+        if not (isinstance(radius, (float, int)) and radius >= 0):
+            raise ValueError("Expected a non-negative number," \
+                                + f" received '{radius}'!")
+        point = self._get_point(color)
+        r2 = radius * radius
+
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                continue
+            i, axis, left, right = self._nodes[node]
+
+            d2 = self._squared_distance(point, i)
+            if d2 <= r2:
+                found.append((d2, i))
+
+            diff = point[axis] - self._points[i][axis]
+            if diff <= radius:
+                stack.append(left)
+            if diff >= -radius:
+                stack.append(right)
+
+        return self._results(found)
+
+# Grouping of near-duplicate colors. Colors are bucketed on a grid over their
+#   OKLAB coordinates with cells tolerance wide, so any color within tolerance
+#   of another lies in the same or a neighboring cell, and each color is only
+#   compared against the few colors in the 27 cells around it. This takes
+#   expected O(N) time, rather than the O(N²) of comparing every pair.
+#
+# Groups are formed greedily in input order: the first color of each group is
+#   its leader, and each color joins the nearest leader within tolerance (the
+#   earliest, in case of a tie), or else leads a new group. Since leaders are
+#   more than tolerance apart, each cell only ever holds a few of them.
+#
+# Without a tolerance, colors are grouped exactly as by Color.is_close(), i.e.
+#   by their hex codes.
+
+# Cells are keyed by a single integer, x * _STRIDE² + y * _STRIDE + z, so each
+#   neighbor is found by adding a fixed offset to the key. The stride is far
+#   larger than the number of cells along any axis for any useful tolerance;
+#   even if it weren't, distinct cells sharing a key would only cost some
+#   extra comparisons, since neighbors are still found at the same offsets.
+_STRIDE = 1 << 21
+_NEIGHBORS = [(x * _STRIDE + y) * _STRIDE + z for x in (-1, 0, 1) \
+                  for y in (-1, 0, 1) for z in (-1, 0, 1)]
+
+def _check_tolerance(tolerance):
+    if tolerance is not None \
+            and not (isinstance(tolerance, (float, int)) and tolerance >= 0):
+        raise ValueError("Expected a non-negative number," \
+                            + f" received '{tolerance}'!")
+
+# Gets the key of every color, which is its hex code without a tolerance, or
+#   its OKLAB triplet with one. color_list may be a list of colors or hex code
+#   strings, or a color array.
+def _get_keys(color_list, tolerance):
+    from . import arrays
+
+    if isinstance(color_list, arrays.ColorArray):
+        if tolerance is None:
+            return color_list.to_HEX()
+        return list(zip(*color_list.to_OKLAB()._channels()))
+
+    ret = []
+    for color in color_list:
+        if isinstance(color, str):
+            color = colors.HEX(color)
+        colors.Color._is_color(color)
+        if tolerance is None:
+            ret.append(color.to_HEX().hex_code)
+        else:
+            lab = color.to_OKLAB()
+            ret.append((lab.l, lab.a, lab.b))
+    return ret
+
+# Gives each key the label of its group, numbered in order of first appearance
+def _label(keys, tolerance):
+    labels = []
+    # Equal keys always share a group, so each distinct key is placed once
+    seen = {}
+    if not tolerance:
+        for key in keys:
+            labels.append(seen.setdefault(key, len(seen)))
+        return labels
+
+    # Each cell holds a list of its leaders as (l, a, b, label)
+    cells = {}
+    n = 0
+    t2 = tolerance * tolerance
+    for key in keys:
+        label = seen.get(key)
+        if label is None:
+            l, a, b = key
+            cell = (int(l // tolerance) * _STRIDE + int(a // tolerance)) \
+                        * _STRIDE + int(b // tolerance)
+
+            best = t2
+            for offset in _NEIGHBORS:
+                for pl, pa, pb, j in cells.get(cell + offset, ()):
+                    d2 = (l - pl)**2 + (a - pa)**2 + (b - pb)**2
+                    if d2 < best \
+                            or d2 == best and (label is None or j < label):
+                        best = d2
+                        label = j
+
+            if label is None:
+                label = n
+                n += 1
+                cells.setdefault(cell, []).append((l, a, b, label))
+            seen[key] = label
+        labels.append(label)
+    return labels
+
+# Groups near-duplicate colors, returning a list of groups in order of first
+#   appearance, each a list of indices into color_list. The first index of
+#   each group is its leader. Colors are grouped by hex code without a
+#   tolerance, or else by euclidean OKLAB distance.
+def group_colors(color_list, tolerance = None):
+    _check_tolerance(tolerance)
+    ret = []
+    for i, label in enumerate(_label(_get_keys(color_list, tolerance),
+                                     tolerance)):
+        if label == len(ret):
+            ret.append([])
+        ret[label].append(i)
+    return ret
+
+# Removes near-duplicate colors, returning the leader of each group in order
+def dedupe(color_list, tolerance = None):
+    from . import arrays
+
+    if not isinstance(color_list, (list, arrays.ColorArray)):
+        color_list = list(color_list)
+    return [color_list[group[0]] \
+                for group in group_colors(color_list, tolerance)]
+
+# Counts the distinct colors, i.e. the number of groups. pixels may also be a
+#   buffer of raw RGB8 bytes (3 bytes per pixel), such as an image's pixels,
+#   which are only converted once for each distinct pixel.
+def count_unique(pixels, tolerance = None):
+    from . import arrays
+
+    _check_tolerance(tolerance)
+    if not isinstance(pixels, arrays.ColorArray):
+        try:
+            view = memoryview(pixels).cast('B')
+        except TypeError:
+            pass
+        else:
+            if len(view) % 3:
+                raise ValueError("Input is not a whole number of RGB pixels!")
+            # Pixels with equal bytes have equal hex codes
+            data = bytes(view)
+            unique = dict.fromkeys(zip(data[0::3], data[1::3], data[2::3]))
+            if tolerance is None:
+                return len(unique)
+            pixels = arrays.RGBArray.from_triplets(unique)
+
+    keys = _get_keys(pixels, tolerance)
+    if tolerance is None:
+        return len(set(keys))
+    return max(_label(keys, tolerance), default=-1) + 1
@@ -0,0 +1,251 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from . import tools
+
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+import types
+
+###############################################################################
+#
+# Instrumentation
+#
+# Counts the calls to, and time spent in, every function in oklch.colors and
+#   oklch.tools, including the methods of the color classes. It is disabled by
+#   default and is turned on with enable_profiling() or profile().
+#
+# Rather than checking a flag on every call, enabling profiling replaces each
+#   function with a wrapper which records its calls, and disabling it puts the
+#   originals back, so there is no cost at all while it is off. Only calls made
+#   through the modules and classes are seen; a reference to a function taken
+#   before profiling was enabled still calls the original. Likewise, calls made
+#   in worker processes (e.g. by map_parallel()) are not counted.
+#
+# Times are inclusive: a function's time includes that of every function it
+#   calls. Wrappers keep the names of the functions they replace, so functions
+#   such as lighten() can still be pickled by reference (to send to
+#   map_parallel(), for example) while profiling is on.
+#
+# Along with calls and time, each entry records:
+#   - for the public functions in tools, the conversions (calls to any of the
+#       colors' to_*() methods, or the _to_*() methods which chained
+#       conversions go through) made while it ran
+#   - for _find_gamut_intersection(), the total Halley iterations, and a
+#       histogram of {iterations: calls}
+#
+###############################################################################
+
+_lock = threading.Lock()
+_local = threading.local()
+_stats = {}
+# The (owner, name, original) of everything replaced, while enabled
+_patched = None
+_depth = 0
+
+def _entry(name):
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = {'calls': 0, 'time': 0.}
+    return entry
+
+def _conversions():
+    return getattr(_local, 'conversions', 0)
+
+def _wrap(name, fn):
+    perf_counter = time.perf_counter
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            with _lock:
+                entry = _entry(name)
+                entry['calls'] += 1
+                entry['time'] += elapsed
+    return wrapper
+
+def _wrap_conversion(name, fn):
+    perf_counter = time.perf_counter
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        _local.conversions = _conversions() + 1
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            with _lock:
+                entry = _entry(name)
+                entry['calls'] += 1
+                entry['time'] += elapsed
+    return wrapper
+
+def _wrap_tool(name, fn):
+    perf_counter = time.perf_counter
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        conversions = _conversions()
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            with _lock:
+                entry = _entry(name)
+                entry['calls'] += 1
+                entry['time'] += elapsed
+                entry['conversions'] = entry.get('conversions', 0) \
+                                          + _conversions() - conversions
+    return wrapper
+
+# The iteration count is asked for and then dropped, unless the caller wanted
+#   it too
+def _wrap_solver(name, fn):
+    perf_counter = time.perf_counter
+    @wraps(fn)
+    def wrapper(*args, return_iterations = False, **kwargs):
+        start = perf_counter()
+        output, n = fn(*args, return_iterations=True, **kwargs)
+        elapsed = perf_counter() - start
+        with _lock:
+            entry = _entry(name)
+            entry['calls'] += 1
+            entry['time'] += elapsed
+            entry['iterations'] = entry.get('iterations', 0) + n
+            histogram = entry.setdefault('histogram', {})
+            histogram[n] = histogram.get(n, 0) + 1
+        return (output, n) if return_iterations else output
+    return wrapper
+
+# Finds everything to be replaced, as (owner, name, original, wrapper)
+def _targets():
+    targets = []
+    # A function imported into more than one module shares a single wrapper
+    wrappers = {}
+
+    for module in (colors, tools):
+        for name, fn in vars(module).items():
+            if not isinstance(fn, types.FunctionType) \
+                    or not fn.__module__.startswith(__package__ + '.'):
+                continue
+            if fn not in wrappers:
+                label = fn.__module__.rsplit('.', 1)[-1] + '.' + name
+                if fn is tools._find_gamut_intersection:
+                    wrappers[fn] = _wrap_solver(label, fn)
+                elif fn.__module__ == tools.__name__ \
+                        and not name.startswith('_'):
+                    wrappers[fn] = _wrap_tool(label, fn)
+                else:
+                    wrappers[fn] = _wrap(label, fn)
+            targets.append((module, name, fn, wrappers[fn]))
+
+    for cls in (colors.Color, colors.RGB, colors.HEX, colors.OKLAB,
+                colors.OKLCH):
+        for name, attr in vars(cls).items():
+            if name.startswith('__'):
+                continue
+            fn = attr.__func__ if isinstance(attr, (staticmethod,
+                                                    classmethod)) else attr
+            if not isinstance(fn, types.FunctionType):
+                continue
+
+            # Chained conversions call each other through the private _to_*()
+            #   methods, which are counted under their public names
+            if name.startswith('_to_'):
+                label = f"colors.{cls.__name__}.{name[1:]}"
+                wrapper = _wrap_conversion(label, fn)
+            else:
+                label = f"colors.{cls.__name__}.{name}"
+                wrapper = _wrap_conversion(label, fn) \
+                              if name.startswith('to_') else _wrap(label, fn)
+            if isinstance(attr, (staticmethod, classmethod)):
+                wrapper = type(attr)(wrapper)
+            targets.append((cls, name, attr, wrapper))
+
+    return targets
+
+# Turns profiling on. Calls to enable_profiling() and disable_profiling() may be
+#   nested, and profiling stays on until every call to enable_profiling() has
+#   been matched.
+def enable_profiling():
+    global _patched, _depth
+
+    with _lock:
+        _depth += 1
+        if _patched is not None:
+            return
+        _patched = []
+        for owner, name, original, wrapper in _targets():
+            setattr(owner, name, wrapper)
+            _patched.append((owner, name, original))
+
+def disable_profiling():
+    global _patched, _depth
+
+    with _lock:
+        if _patched is None:
+            return
+        _depth -= 1
+        if _depth > 0:
+            return
+        for owner, name, original in reversed(_patched):
+            setattr(owner, name, original)
+        _patched = None
+        # The conversion cache may have been toggled in the meantime
+        colors._install_conversions()
+
+def is_profiling():
+    return _patched is not None
+
+# Returns a snapshot of the counters as a dictionary of {name: entry}, with an
+#   entry for each function called so far. Names are given as e.g.
+#   'tools.find_cusp' or 'colors.RGB.to_OKLAB'.
+def profile_info():
+    with _lock:
+        return {name: {k: dict(v) if isinstance(v, dict) else v \
+                           for k, v in entry.items()} \
+                    for name, entry in _stats.items()}
+
+# Resets the counters
+def profile_clear():
+    with _lock:
+        _stats.clear()
+
+# Gives the counters which changed from before to after
+def _difference(before, after):
+    ret = {}
+    for name, entry in after.items():
+        old = before.get(name, {})
+        if entry['calls'] == old.get('calls', 0):
+            continue
+        diff = {}
+        for k, v in entry.items():
+            if isinstance(v, dict):
+                o = old.get(k, {})
+                diff[k] = {n: c - o.get(n, 0) for n, c in v.items() \
+                               if c != o.get(n, 0)}
+            else:
+                diff[k] = v - old.get(k, 0)
+        ret[name] = diff
+    return ret
+
+# Profiles the body of a with statement:
+#   with oklch.profile() as stats:
+#       ...
+#   stats is filled with the counters for the calls made within the body once
+#   it exits, in the same form as profile_info().
+@contextmanager
+def profile():
+    stats = {}
+    enable_profiling()
+    before = profile_info()
+    try:
+        yield stats
+    finally:
+        after = profile_info()
+        disable_profiling()
+        stats.update(_difference(before, after))
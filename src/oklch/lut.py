@@ -0,0 +1,482 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from .arrays import RGBArray, OKLABArray, OKLCHArray, _typecode
+
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+# An 8-bit sRGB color can only take 256^3 = 16,777,216 values, so every one of
+#   them can be converted to OKLAB ahead of time and stored in a table. Tables
+#   are stored as binary files which are memory-mapped on demand, so the
+#   operating system only loads the pages which are actually used, and shares
+#   them between every process which maps the same file.
+#
+# A full table (size 256) holds every 8-bit color exactly, and takes ~200 MB as
+#   float32 ('f'), ~100 MB as float16 ('e'), or ~400 MB as float64 ('d').
+#   Smaller tables sample the RGB cube on an evenly spaced size^3 grid and
+#   interpolate trilinearly between the samples; a size of 33 takes ~430 KB
+#   as float32, and 64 takes ~3 MB. Over random 8-bit colors, 99.9% are then
+#   within 0.0008 (33) or 0.0002 (64) of the exact conversion, as a distance
+#   in OKLAB. The error is only larger in the grid cell next to black, where
+#   the conversion curves the most: up to about 0.047 (33) or 0.037 (64), for
+#   colors such as (0, 1, 0).
+#
+# The file consists of a 32-byte header followed by the OKLAB triplets for each
+#   grid point, with r varying slowest and b fastest.
+
+_MAGIC = b'OKLABLUT'
+_VERSION = 1
+_HEADER = struct.Struct('<8sHccI16x')
+_TYPECODES = ('e', 'f', 'd')
+
+# Writes a table of the given size and typecode to path. Building a full table
+#   takes a while, but only ever needs to be done once.
+def build_lut(path, size = 256, typecode = 'f'):
+    if not (isinstance(size, int) and 2 <= size <= 256):
+        raise ValueError("Expected an integer in the range [2,256], received" \
+                            + f" '{size}'!")
+    if typecode not in _TYPECODES:
+        raise ValueError(f"Unknown typecode: '{typecode}'! Valid typecodes" \
+                            + " are 'e', 'f', and 'd'.")
+
+    # Linearizing each channel doesn't depend on the other two, so it only
+    #   needs doing once per grid value
+    inv = colors.RGB._srgb_transfer_function_inv
+    linear = [inv(i * 255 / (size - 1) / 255) for i in range(size)]
+
+    byteorder = b'<' if sys.byteorder == 'little' else b'>'
+    pack = struct.Struct(f'{byteorder.decode()}{3 * size * size}{typecode}')
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, typecode.encode(), byteorder,
+                             size))
+
+        # Written one slab of constant r at a time to keep memory bounded
+        for r in linear:
+            slab = []
+            for g in linear:
+                for b in linear:
+                    l_ = (0.4122214708 * r + 0.5363325363 * g \
+                            + 0.0514459929 * b) ** (1/3)
+                    m_ = (0.2119034982 * r + 0.6806995451 * g \
+                            + 0.1073969566 * b) ** (1/3)
+                    s_ = (0.0883024619 * r + 0.2817188376 * g \
+                            + 0.6299787005 * b) ** (1/3)
+
+                    slab.append(0.2104542553*l_ + 0.7936177850*m_ \
+                                    - 0.0040720468*s_)
+                    slab.append(1.9779984951*l_ - 2.4285922050*m_ \
+                                    + 0.4505937099*s_)
+                    slab.append(0.0259040371*l_ + 0.7827717662*m_ \
+                                    - 0.8086757660*s_)
+            f.write(pack.pack(*slab))
+
+# A memory-mapped RGB8 -> OKLAB table, as written by build_lut()
+class RGBLut:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f"'{path}' is not an OKLAB lookup table!")
+            magic, version, typecode, byteorder, size = \
+                    _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"'{path}' is not an OKLAB lookup table!")
+
+            self.size = size
+            self.typecode = typecode.decode()
+            itemsize = struct.calcsize(self.typecode)
+            expected = _HEADER.size + 3 * size ** 3 * itemsize
+            if os.fstat(f.fileno()).st_size != expected:
+                raise ValueError(f"'{path}' is truncated!")
+
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        native = byteorder == (b'<' if sys.byteorder == 'little' else b'>')
+        if native and self.typecode != 'e':
+            # Native floats can be read directly through a memoryview
+            self._view = memoryview(self._mmap)[_HEADER.size:] \
+                            .cast(self.typecode)
+            self._struct = None
+        else:
+            self._view = None
+            self._struct = struct.Struct(byteorder.decode() + '3' \
+                                            + self.typecode)
+            self._itemsize = 3 * itemsize
+
+        self._scale = (size - 1) / 255
+        self._full = size == 256 and self._view is not None
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+        self._mmap.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+    # Reads the triplet at the given grid point
+    def _get(self, i):
+        if self._view is not None:
+            i *= 3
+            return self._view[i], self._view[i+1], self._view[i+2]
+        return self._struct.unpack_from(self._mmap,
+                                        _HEADER.size + i * self._itemsize)
+
+    # Returns the OKLAB components of an RGB color as a tuple, or None if the
+    #   color is out of the table's range
+    def lookup(self, r, g, b):
+        # Integer channels index a full table directly
+        if self._full and type(r) is int and type(g) is int \
+                and type(b) is int and 0 <= r <= 255 and 0 <= g <= 255 \
+                and 0 <= b <= 255:
+            i = 3 * ((r << 16) | (g << 8) | b)
+            view = self._view
+            return view[i], view[i+1], view[i+2]
+
+        if not (0 <= r <= 255 and 0 <= g <= 255 and 0 <= b <= 255):
+            return None
+        n = self.size
+        x = r * self._scale
+        y = g * self._scale
+        z = b * self._scale
+
+        i = min(int(x), n - 2)
+        j = min(int(y), n - 2)
+        k = min(int(z), n - 2)
+        fx = x - i
+        fy = y - j
+        fz = z - k
+
+        # Grid points need no interpolation
+        if fx == 0 and fy == 0 and fz == 0:
+            return self._get((i * n + j) * n + k)
+
+        # Trilinear interpolation between the eight surrounding grid points
+        get = self._get
+        base = (i * n + j) * n + k
+        ret = []
+        c000 = get(base)
+        c001 = get(base + 1)
+        c010 = get(base + n)
+        c011 = get(base + n + 1)
+        c100 = get(base + n * n)
+        c101 = get(base + n * n + 1)
+        c110 = get(base + n * n + n)
+        c111 = get(base + n * n + n + 1)
+        for q in range(3):
+            c00 = c000[q] + (c001[q] - c000[q]) * fz
+            c01 = c010[q] + (c011[q] - c010[q]) * fz
+            c10 = c100[q] + (c101[q] - c100[q]) * fz
+            c11 = c110[q] + (c111[q] - c110[q]) * fz
+            c0 = c00 + (c01 - c00) * fy
+            c1 = c10 + (c11 - c10) * fy
+            ret.append(c0 + (c1 - c0) * fx)
+        return tuple(ret)
+
+    # Converts a color to OKLAB using the table, falling back to the exact
+    #   conversion for out-of-range colors
+    def to_OKLAB(self, color):
+        colors.Color._is_color(color)
+        rgb = color.to_RGB()
+        lab = self.lookup(rgb.r, rgb.g, rgb.b)
+        if lab is None:
+            return colors.RGB.to_OKLAB(rgb, use_lut=False)
+        return colors.OKLAB(*lab)
+    def to_OKLCH(self, color):
+        return self.to_OKLAB(color).to_OKLCH()
+
+    # Converts a whole RGBArray, giving an OKLABArray
+    def convert(self, rgb):
+        if not isinstance(rgb, RGBArray):
+            raise ValueError(f"Expected RGB array, received '{type(rgb)}'!")
+
+        # If every channel is an integer in range, a full table can be indexed
+        #   directly
+        if self._full and len(rgb) and min(rgb.data) >= 0 \
+                and max(rgb.data) <= 255 \
+                and (_typecode(rgb.data) == 'B' \
+                     or all(x.is_integer() for x in rgb.data)):
+            view = self._view
+            R, G, B = rgb._channels()
+            l, a, b = [], [], []
+            for r, g, b_ in zip(map(int, R), map(int, G), map(int, B)):
+                i = 3 * ((r << 16) | (g << 8) | b_)
+                l.append(view[i])
+                a.append(view[i+1])
+                b.append(view[i+2])
+            return OKLABArray._from_channels(l, a, b)
+
+        data = array('d')
+        lookup = self.lookup
+        for r, g, b in zip(*rgb._channels()):
+            lab = lookup(r, g, b)
+            if lab is None:
+                lab = RGBArray((r, g, b)).to_OKLAB(use_lut=False).data
+            data.extend(lab)
+        return OKLABArray(data)
+
+# Sets the table used as a fast path by RGB.to_OKLAB() and RGBArray.to_OKLAB()
+#   (and therefore every conversion from RGB), or disables it with None.
+#   Returns the previous table.
+def use_lut(lut):
+    if lut is not None and not isinstance(lut, RGBLut):
+        raise ValueError(f"Expected RGBLut, received '{type(lut)}'!")
+
+    previous = colors._rgb_lut
+    colors._rgb_lut = lut
+    return previous
+
+###############################################################################
+#
+# Transform tables
+#
+# A chain of operations (a Pipeline, or any other function of a color) can be
+#   compiled into an RGB -> RGB table by running it once on each point of an
+#   evenly spaced size^3 grid over the RGB cube. Applying the table then costs
+#   a single interpolation per pixel, however many steps the chain has, rather
+#   than paying for every step's conversions, cusp lookups, and clipping.
+#
+# Between grid points, results are interpolated either trilinearly, from the
+#   eight surrounding points, or tetrahedrally, from the four corners of the
+#   tetrahedron around the input, which is cheaper and follows the neutral
+#   (grey) axis exactly. Operations which clip or bend sharply at the edge of
+#   the gamut are smoothed out somewhat, so larger tables track them better.
+#
+# Tables use the same layout as the .cube format: RGB triplets in [0,1], with r
+#   varying fastest and b slowest, and can be saved to and loaded from .cube
+#   files for use elsewhere (ffmpeg's lut3d filter or a shader, for example).
+#
+###############################################################################
+_INTERPOLATIONS = ('trilinear', 'tetrahedral')
+
+class TransformLut:
+    # table holds the size^3 output RGB triplets in [0,1], in .cube order
+    def __init__(self, size, table,
+                 interpolation = 'tetrahedral',
+                 title = None):
+
+        if not (isinstance(size, int) and size >= 2):
+            raise ValueError("Expected an integer of at least 2, received" \
+                                + f" '{size}'!")
+        if len(table) != 3 * size ** 3:
+            raise ValueError(f"Expected {3 * size ** 3} values, received" \
+                                + f" '{len(table)}'!")
+        if interpolation not in _INTERPOLATIONS:
+            raise ValueError(f"""Unknown interpolation: '{interpolation}'!
+Valid interpolations are 'trilinear' and 'tetrahedral'.""")
+
+        self.size = size
+        self.table = array('d', table)
+        self.interpolation = interpolation
+        self.title = title
+
+        # Each channel value in [0,255] falls between the same two grid points
+        #   whatever the other channels are, so the index and fraction for
+        #   every 8-bit value are worked out once
+        scale = (size - 1) / 255
+        self._index = []
+        self._fraction = []
+        for v in range(256):
+            x = v * scale
+            i = min(int(x), size - 2)
+            self._index.append(i)
+            self._fraction.append(x - i)
+
+    # Finds the output for an RGB color, with each channel in [0,255], as a
+    #   tuple in [0,1]. Channels outside the range are clamped.
+    def _interpolate(self, r, g, b):
+        n = self.size
+        if type(r) is int and type(g) is int and type(b) is int \
+                and 0 <= r <= 255 and 0 <= g <= 255 and 0 <= b <= 255:
+            i, j, k = self._index[r], self._index[g], self._index[b]
+            fx, fy, fz = self._fraction[r], self._fraction[g], \
+                         self._fraction[b]
+        else:
+            scale = (n - 1) / 255
+            x = min(max(r, 0), 255) * scale
+            y = min(max(g, 0), 255) * scale
+            z = min(max(b, 0), 255) * scale
+            i = min(int(x), n - 2)
+            j = min(int(y), n - 2)
+            k = min(int(z), n - 2)
+            fx, fy, fz = x - i, y - j, z - k
+
+        T = self.table
+        sx, sy, sz = 3, 3 * n, 3 * n * n
+        base = 3 * ((k * n + j) * n + i)
+
+        if self.interpolation == 'trilinear':
+            ret = []
+            for q in range(base, base + 3):
+                c00 = T[q] + (T[q + sx] - T[q]) * fx
+                c01 = T[q + sz] + (T[q + sz + sx] - T[q + sz]) * fx
+                c10 = T[q + sy] + (T[q + sy + sx] - T[q + sy]) * fx
+                c11 = T[q + sy + sz] \
+                        + (T[q + sy + sz + sx] - T[q + sy + sz]) * fx
+                c0 = c00 + (c10 - c00) * fy
+                c1 = c01 + (c11 - c01) * fy
+                ret.append(c0 + (c1 - c0) * fz)
+            return tuple(ret)
+
+        # Walk from the lower corner to the upper corner along the axes in
+        #   order of decreasing fraction; the four corners visited are those of
+        #   the tetrahedron holding the input
+        if fx >= fy:
+            if fy >= fz:
+                s1, s2, w1, w2, w3 = sx, sy, fx, fy, fz
+            elif fx >= fz:
+                s1, s2, w1, w2, w3 = sx, sz, fx, fz, fy
+            else:
+                s1, s2, w1, w2, w3 = sz, sx, fz, fx, fy
+        else:
+            if fz >= fy:
+                s1, s2, w1, w2, w3 = sz, sy, fz, fy, fx
+            elif fz >= fx:
+                s1, s2, w1, w2, w3 = sy, sz, fy, fz, fx
+            else:
+                s1, s2, w1, w2, w3 = sy, sx, fy, fx, fz
+
+        c1 = base + s1
+        c2 = c1 + s2
+        c3 = base + sx + sy + sz
+        a0, a1, a2 = 1 - w1, w1 - w2, w2 - w3
+        return tuple(a0 * T[base + q] + a1 * T[c1 + q] + a2 * T[c2 + q] \
+                         + w3 * T[c3 + q] for q in range(3))
+
+    # Returns the output for the given RGB channels as a tuple of channels in
+    #   [0,255]
+    def lookup(self, r, g, b):
+        return tuple(x * 255 for x in self._interpolate(r, g, b))
+
+    # Applies the table to a single color, giving an RGB color
+    def __call__(self, color):
+        colors.Color._is_color(color)
+        rgb = color.to_RGB()
+        return colors.RGB(*self.lookup(rgb.r, rgb.g, rgb.b))
+
+    # Applies the table to a whole RGBArray, giving a new RGBArray
+    def convert(self, rgb):
+        if not isinstance(rgb, RGBArray):
+            raise ValueError(f"Expected RGB array, received '{type(rgb)}'!")
+
+        data = array('d')
+        interpolate = self._interpolate
+        for r, g, b in zip(*rgb._channels()):
+            data.extend(interpolate(r, g, b))
+        for i in range(len(data)):
+            data[i] *= 255
+        return RGBArray(data)
+
+    # Applies the table to a buffer of raw RGB8 bytes (3 bytes per pixel),
+    #   returning the result as bytes. Each distinct pixel is only
+    #   interpolated once.
+    def apply(self, buffer):
+        view = memoryview(buffer).cast('B')
+        if len(view) % 3:
+            raise ValueError("Input is not a whole number of RGB pixels!")
+        data = bytes(view)
+        pixels = list(zip(data[0::3], data[1::3], data[2::3]))
+
+        out = {}
+        interpolate = self._interpolate
+        for px in dict.fromkeys(pixels):
+            out[px] = bytes(min(255, max(0, int(x * 255 + 0.5))) \
+                                for x in interpolate(*px))
+        return b''.join(map(out.__getitem__, pixels))
+
+    # Writes the table to a .cube file
+    def save_cube(self, path):
+        with open(path, 'w') as f:
+            if self.title is not None:
+                f.write(f'TITLE "{self.title}"\n')
+            f.write(f"LUT_3D_SIZE {self.size}\n")
+            f.write("DOMAIN_MIN 0.0 0.0 0.0\n")
+            f.write("DOMAIN_MAX 1.0 1.0 1.0\n")
+            T = self.table
+            for i in range(0, len(T), 3):
+                f.write(f"{T[i]:.6f} {T[i+1]:.6f} {T[i+2]:.6f}\n")
+
+    # Reads a table from a .cube file. Only 3D tables over the default domain
+    #   of [0,1] are supported.
+    @classmethod
+    def load_cube(cls, path, interpolation = 'tetrahedral'):
+        size = None
+        title = None
+        table = array('d')
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                keyword = line.split(None, 1)[0]
+
+                if keyword == 'TITLE':
+                    title = line[len('TITLE'):].strip().strip('"')
+                elif keyword == 'LUT_3D_SIZE':
+                    size = int(line.split()[1])
+                elif keyword in ('DOMAIN_MIN', 'DOMAIN_MAX'):
+                    bound = 0. if keyword == 'DOMAIN_MIN' else 1.
+                    if any(float(x) != bound for x in line.split()[1:]):
+                        raise ValueError(f"'{path}' has an unsupported" \
+                                            + " domain!")
+                elif keyword == 'LUT_1D_SIZE':
+                    raise ValueError(f"'{path}' is a 1D table, which is not" \
+                                        + " supported!")
+                else:
+                    try:
+                        values = [float(x) for x in line.split()]
+                    except ValueError:
+                        raise ValueError(f"'{path}' is not a valid .cube" \
+                                            + f" file! Unexpected '{line}'.")
+                    if len(values) != 3:
+                        raise ValueError(f"'{path}' is not a valid .cube" \
+                                            + f" file! Unexpected '{line}'.")
+                    table.extend(values)
+
+        if size is None:
+            raise ValueError(f"'{path}' has no LUT_3D_SIZE!")
+        if len(table) != 3 * size ** 3:
+            raise ValueError(f"'{path}' is truncated!")
+        return cls(size, table, interpolation, title)
+
+# Compiles op, which is given each grid point as an OKLCH color and may return
+#   a color of any type, into a TransformLut with size samples per channel.
+#   Results outside of the RGB gamut are clamped.
+def compile_lut(op, size = 33, interpolation = 'tetrahedral', title = None):
+    if not callable(op):
+        raise ValueError(f"Expected callable, received '{type(op)}'!")
+    if not (isinstance(size, int) and 2 <= size <= 256):
+        raise ValueError("Expected an integer in the range [2,256], received" \
+                            + f" '{size}'!")
+
+    # Every grid point is converted in one batch, in .cube order
+    levels = [i * 255 / (size - 1) for i in range(size)]
+    grid = RGBArray([x for b in levels for g in levels for r in levels \
+                         for x in (r, g, b)])
+    out = OKLCHArray.from_colors([op(c) for c in grid.to_OKLCH()]).to_OKLAB()
+
+    # The results are converted back to RGB here rather than with to_RGB(),
+    #   which would round them to 8 bits
+    encode = colors.RGB._srgb_transfer_function
+    table = array('d')
+    for L, a, b in zip(*out._channels()):
+        l_ = L + 0.3963377774 * a + 0.2158037573 * b
+        m_ = L - 0.1055613458 * a - 0.0638541728 * b
+        s_ = L - 0.0894841775 * a - 1.2914855480 * b
+
+        l = l_*l_*l_
+        m = m_*m_*m_
+        s = s_*s_*s_
+
+        for x in (+4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s,
+                  -1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s,
+                  -0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s):
+            table.append(encode(min(1., max(0., x))))
+    return TransformLut(size, table, interpolation, title)
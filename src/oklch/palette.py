@@ -0,0 +1,248 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from .arrays import ColorArray, RGBArray, OKLABArray
+
+import random
+
+# Dominant-color extraction. Pixels are converted to OKLAB in a single batch
+#   and clustered there, where euclidean distance tracks perceived difference.
+#   Large inputs are subsampled to at most max_samples pixels, and repeats of
+#   the same pixel are merged into a single weighted point, so the cost of
+#   clustering depends on the number of distinct colors sampled rather than the
+#   size of the image.
+#
+# Two methods are available:
+#   - 'kmeans': k-means with k-means++ initialization, refined with Lloyd's
+#       algorithm or, given a batch_size, with mini-batch updates
+#   - 'median_cut': repeatedly splits the box of points with the largest spread
+#       at the weighted median of its longest axis
+#
+# The results are given as a list of (OKLCH, weight) tuples, sorted from the
+#   most to the least common, where each weight is the fraction of the sampled
+#   pixels closest to that palette color.
+
+# Gets weighted OKLAB points from a list of colors, a color array, or a buffer
+#   of raw RGB8 bytes (3 bytes per pixel)
+def _get_points(pixels, max_samples, rng):
+    view = None
+    if not isinstance(pixels, ColorArray):
+        try:
+            view = memoryview(pixels).cast('B')
+        except TypeError:
+            pixels = OKLABArray.from_colors(pixels)
+
+    if view is None:
+        n = len(pixels)
+        indices = range(n)
+        if n > max_samples:
+            indices = sorted(rng.sample(indices, max_samples))
+
+        counts = {}
+        X, Y, Z = pixels._channels()
+        for i in indices:
+            key = (X[i], Y[i], Z[i])
+            counts[key] = counts.get(key, 0) + 1
+        lab = type(pixels).from_triplets(counts).to_OKLAB()
+
+    else:
+        if len(view) % 3:
+            raise ValueError("Input is not a whole number of RGB pixels!")
+        n = len(view) // 3
+        indices = range(n)
+        if n > max_samples:
+            indices = rng.sample(indices, max_samples)
+
+        counts = {}
+        for i in indices:
+            key = bytes(view[3*i:3*i+3])
+            counts[key] = counts.get(key, 0) + 1
+        lab = RGBArray([x for px in counts for x in px]).to_OKLAB()
+
+    L, A, B = (list(x) for x in lab._channels())
+    return L, A, B, list(counts.values())
+
+# Finds the index of the nearest center to a point
+def _nearest(l, a, b, centers):
+    best = 0
+    best_d = float('inf')
+    for j, (cl, ca, cb) in enumerate(centers):
+        d = (l - cl)**2 + (a - ca)**2 + (b - cb)**2
+        if d < best_d:
+            best = j
+            best_d = d
+    return best
+
+# Finds the index of the nearest center to every point. Distances are compared
+#   one center at a time across all of the points, which is much faster than
+#   looping over the centers for each point; the squared norm of each point is
+#   left out, since it's the same for every center.
+def _assign(L, A, B, centers):
+    labels = [0] * len(L)
+    best = None
+    for j, (cl, ca, cb) in enumerate(centers):
+        x, y, z = -2 * cl, -2 * ca, -2 * cb
+        w = cl*cl + ca*ca + cb*cb
+        d = [w + x*l + y*a + z*b for l, a, b in zip(L, A, B)]
+        if best is None:
+            best = d
+            continue
+        labels = [j if dj < bj else lj \
+                      for dj, bj, lj in zip(d, best, labels)]
+        best = [dj if dj < bj else bj for dj, bj in zip(d, best)]
+    return labels
+
+# Picks k starting centers, each with a probability proportional to its weight
+#   times its squared distance from the nearest center already picked
+def _kmeans_plus_plus(L, A, B, W, k, rng):
+    n = len(L)
+    i = rng.choices(range(n), weights=W)[0]
+    centers = [(L[i], A[i], B[i])]
+    D = [W[j] * ((L[j] - L[i])**2 + (A[j] - A[i])**2 + (B[j] - B[i])**2) \
+             for j in range(n)]
+
+    while len(centers) < k:
+        total = sum(D)
+        # Every point coincides with a center
+        if total <= 0:
+            break
+        i = rng.choices(range(n), weights=D)[0]
+        c = (L[i], A[i], B[i])
+        centers.append(c)
+        for j in range(n):
+            d = W[j] * ((L[j] - c[0])**2 + (A[j] - c[1])**2 \
+                            + (B[j] - c[2])**2)
+            if d < D[j]:
+                D[j] = d
+    return centers
+
+# Lloyd's algorithm: assign every point to its nearest center, then move each
+#   center to the weighted mean of its points, until nothing changes
+def _lloyd(L, A, B, W, centers, iterations):
+    labels = None
+    for _ in range(iterations):
+        new_labels = _assign(L, A, B, centers)
+        if new_labels == labels:
+            break
+        labels = new_labels
+
+        sums = [[0., 0., 0., 0] for _ in centers]
+        for i, j in enumerate(labels):
+            s = sums[j]
+            w = W[i]
+            s[0] += w * L[i]
+            s[1] += w * A[i]
+            s[2] += w * B[i]
+            s[3] += w
+        centers = [(s[0] / s[3], s[1] / s[3], s[2] / s[3]) if s[3] else c \
+                       for s, c in zip(sums, centers)]
+    return centers
+
+# Mini-batch k-means: each iteration only looks at batch_size points, drawn
+#   according to their weights, and moves each center towards its points with a
+#   learning rate that decays as the center sees more points
+def _mini_batch(L, A, B, W, centers, iterations, batch_size, rng):
+    centers = [list(c) for c in centers]
+    seen = [0] * len(centers)
+    n = len(L)
+    for _ in range(iterations):
+        batch = rng.choices(range(n), weights=W, k=batch_size)
+        for i in batch:
+            j = _nearest(L[i], A[i], B[i], centers)
+            seen[j] += 1
+            rate = 1 / seen[j]
+            c = centers[j]
+            c[0] += (L[i] - c[0]) * rate
+            c[1] += (A[i] - c[1]) * rate
+            c[2] += (B[i] - c[2]) * rate
+    return [tuple(c) for c in centers]
+
+def _median_cut(L, A, B, W, k):
+    channels = (L, A, B)
+    boxes = [list(range(len(L)))]
+    while len(boxes) < k:
+        # Split the box whose longest axis, weighted by population, is largest
+        best = None
+        for n, box in enumerate(boxes):
+            if len(box) < 2:
+                continue
+            for axis, X in enumerate(channels):
+                spread = max(X[i] for i in box) - min(X[i] for i in box)
+                score = spread * sum(W[i] for i in box)
+                if spread > 0 and (best is None or score > best[0]):
+                    best = (score, n, axis)
+        if best is None:
+            break
+
+        _, n, axis = best
+        X = channels[axis]
+        box = sorted(boxes.pop(n), key=X.__getitem__)
+        half = sum(W[i] for i in box) / 2
+        total = 0
+        for cut, i in enumerate(box):
+            total += W[i]
+            if total >= half:
+                break
+        # Both halves need at least one point
+        cut = min(max(cut + 1, 1), len(box) - 1)
+        boxes.extend((box[:cut], box[cut:]))
+
+    centers = []
+    for box in boxes:
+        w = sum(W[i] for i in box)
+        centers.append((sum(W[i] * L[i] for i in box) / w,
+                        sum(W[i] * A[i] for i in box) / w,
+                        sum(W[i] * B[i] for i in box) / w))
+    return centers
+
+# Extracts a palette of up to k colors from pixels, which may be a list of
+#   colors, a color array, or a buffer of raw RGB8 bytes. Fewer than k colors
+#   are returned if there are fewer distinct pixels.
+def extract_palette(pixels,
+                    k = 8,
+                    method = 'kmeans',
+                    max_samples = 16384,
+                    iterations = 20,
+                    batch_size = None,
+                    seed = 0):
+
+    if not (isinstance(k, int) and k > 0):
+        raise ValueError(f"Expected a positive integer, received '{k}'!")
+    if method not in ('kmeans', 'median_cut'):
+        raise ValueError(f"""Unknown method: '{method}'!
+Valid methods are 'kmeans' and 'median_cut'.""")
+    if not (isinstance(max_samples, int) and max_samples > 0):
+        raise ValueError("Expected a positive integer, received" \
+                            + f" '{max_samples}'!")
+    if not (isinstance(iterations, int) and iterations >= 0):
+        raise ValueError("Expected a non-negative integer, received" \
+                            + f" '{iterations}'!")
+    if batch_size is not None \
+            and not (isinstance(batch_size, int) and batch_size > 0):
+        raise ValueError("Expected a positive integer, received" \
+                            + f" '{batch_size}'!")
+
+    rng = random.Random(seed)
+    L, A, B, W = _get_points(pixels, max_samples, rng)
+    if not L:
+        return []
+
+    if method == 'median_cut':
+        centers = _median_cut(L, A, B, W, k)
+    else:
+        centers = _kmeans_plus_plus(L, A, B, W, k, rng)
+        if batch_size is None:
+            centers = _lloyd(L, A, B, W, centers, iterations)
+        else:
+            centers = _mini_batch(L, A, B, W, centers, iterations, batch_size,
+                                  rng)
+
+    # Weigh each palette color by the pixels nearest to it
+    weights = [0] * len(centers)
+    for j, w in zip(_assign(L, A, B, centers), W):
+        weights[j] += w
+    total = sum(W)
+
+    ret = [(colors.OKLAB(*c).to_OKLCH(), w / total) \
+               for c, w in zip(centers, weights) if w]
+    ret.sort(key=lambda x: -x[1])
+    return ret
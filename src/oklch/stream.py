@@ -0,0 +1,125 @@
+# vim:foldmethod=indent:foldlevel=1
+from . import colors
+from .arrays import RGBArray, OKLCHArray
+from .lut import compile_lut
+
+# A pipeline applies a chain of operations, such as those in oklch.tools, to
+#   every pixel of a raw RGB8 buffer (3 bytes per pixel). Pixels are read,
+#   converted, and written back out in fixed-size chunks, so the memory used
+#   does not depend on the size of the input.
+#
+# Images usually contain many repeats of the same pixel, so the result for each
+#   distinct input pixel is remembered and reused; this memo is emptied
+#   whenever it grows past max_cache entries to keep memory bounded.
+class Pipeline:
+    def __init__(self, chunk_size = 65536, max_cache = 1 << 20):
+        if not (isinstance(chunk_size, int) and chunk_size > 0):
+            raise ValueError("Expected a positive integer, received" \
+                                + f" '{chunk_size}'!")
+        if not (isinstance(max_cache, int) and max_cache >= 0):
+            raise ValueError("Expected a non-negative integer, received" \
+                                + f" '{max_cache}'!")
+
+        self.chunk_size = chunk_size
+        self.max_cache = max_cache
+        self.steps = []
+        self._cache = {}
+
+    # Adds a step to the pipeline and returns the pipeline so that calls can be
+    #   chained. Each pixel is passed to op as an OKLCH object, following any
+    #   other positional arguments, i.e. op(*args, color, **kwargs); so
+    #   then(tools.lighten, 0.2) calls tools.lighten(0.2, color).
+    def then(self, op, *args, **kwargs):
+        if not callable(op):
+            raise ValueError(f"Expected callable, received '{type(op)}'!")
+
+        self.steps.append((op, args, kwargs))
+        self._cache.clear()
+        return self
+
+    # Applies every step to a single color
+    def __call__(self, color):
+        colors.Color._is_color(color)
+        for op, args, kwargs in self.steps:
+            color = op(*args, color, **kwargs)
+        return color
+
+    # Compiles every step into a single TransformLut; see lut.compile_lut()
+    def compile(self, size = 33, interpolation = 'tetrahedral', title = None):
+        return compile_lut(self, size, interpolation, title)
+
+    # Converts a chunk of raw RGB8 bytes
+    def _process_chunk(self, chunk):
+        cache = self._cache
+
+        # Find the distinct pixels we haven't seen before
+        todo = {}
+        for i in range(0, len(chunk), 3):
+            px = bytes(chunk[i:i+3])
+            if px not in cache:
+                todo[px] = None
+
+        if todo:
+            # Every pixel of the chunk must be in the memo when the output is
+            #   joined below, so emptying it means redoing the whole chunk
+            if len(cache) + len(todo) > self.max_cache:
+                cache.clear()
+                todo = dict.fromkeys(bytes(chunk[i:i+3]) \
+                                         for i in range(0, len(chunk), 3))
+
+            lch = RGBArray([x for px in todo for x in px]).to_OKLCH()
+            out = OKLCHArray.from_colors([self(c) for c in lch]).to_RGB()
+            for px, (r, g, b) in zip(todo, out.to_triplets()):
+                cache[px] = bytes((min(255, max(0, int(r))),
+                                   min(255, max(0, int(g))),
+                                   min(255, max(0, int(b)))))
+
+        ret = b''.join([cache[bytes(chunk[i:i+3])] \
+                            for i in range(0, len(chunk), 3)])
+
+        if len(cache) > self.max_cache:
+            cache.clear()
+        return ret
+
+    # Yields the converted pixels chunk by chunk. src may be any object
+    #   exposing the buffer protocol (bytes, bytearray, memoryview, mmap, ...)
+    #   or a binary file object.
+    def process(self, src):
+        size = 3 * self.chunk_size
+
+        if hasattr(src, 'readinto'):
+            buf = bytearray(size)
+            view = memoryview(buf)
+            leftover = b''
+            while True:
+                n = src.readinto(view[len(leftover):])
+                if not n:
+                    break
+                # readinto() may return a partial chunk, which might not hold a
+                #   whole number of pixels
+                n += len(leftover)
+                whole = n - n % 3
+                yield self._process_chunk(view[:whole])
+                leftover = bytes(view[whole:n])
+                view[:len(leftover)] = leftover
+            if leftover:
+                raise ValueError("Input is not a whole number of RGB pixels!")
+
+        else:
+            view = memoryview(src).cast('B')
+            if len(view) % 3:
+                raise ValueError("Input is not a whole number of RGB pixels!")
+            for i in range(0, len(view), size):
+                yield self._process_chunk(view[i:i+size])
+
+    # Converts every pixel of src and writes the result to dst, which may be a
+    #   binary file object or a bytearray. Returns the number of pixels written
+    def run(self, src, dst):
+        n = 0
+        for chunk in self.process(src):
+            if hasattr(dst, 'write'):
+                dst.write(chunk)
+            else:
+                dst += chunk
+            n += len(chunk) // 3
+        return n
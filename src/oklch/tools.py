@@ -1,8 +1,13 @@
 # vim:foldmethod=indent:foldlevel=1
 from . import colors
 
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import math
+import os
 import sys
+import threading
 
 # Prints a color to terminal by setting the terminal background to that color
 #   using ANSI control codes
@@ -150,7 +155,7 @@ def _max_saturation(a, b):
 # The minimum information needed for this function is simply a hue, which can
 #   either be specified directly or inferred from a color object. 
 # finds L_cusp and C_cusp for a given hue
-def find_cusp(hue=None, color=None):
+def find_cusp(hue=None, color=None, use_table=False):
 
     # Either color or hue may be provided, but exactly one is required. 
     assert (hue == None) ^ (color == None), \
@@ -167,6 +172,21 @@ def find_cusp(hue=None, color=None):
             color = color.to_OKLCH()
         hue = color.h
 
+    if _cache is not None:
+        key = ('cusp', _cache.quantize(hue % 360), use_table)
+        L_cusp, C_cusp = _cache.lookup(key, _get_cusp, hue, use_table)
+    else:
+        L_cusp, C_cusp = _get_cusp(hue, use_table)
+
+    return colors.OKLCH(L_cusp, C_cusp, hue)
+
+def _get_cusp(hue, use_table):
+    if use_table:
+        return _lookup_cusp(hue)
+    return _compute_cusp(hue)
+
+# Computes L_cusp and C_cusp exactly for the given hue
+def _compute_cusp(hue):
     # a and b must be normalized so a^2 + b^2 == 1
     a, b = colors.OKLCH._get_normalized_ab(hue)
   
@@ -176,13 +196,94 @@ def find_cusp(hue=None, color=None):
     # Convert to linear sRGB to find the first point where at least one of r,g,
     #   or b >= 1:
     rgb_at_max = colors.OKLAB(1, S_cusp * a, S_cusp * b).to_RGB()
-    rgb_at_max.r = colors.RGB._srgb_transfer_function_inv(rgb_at_max.r/255)
-    rgb_at_max.g = colors.RGB._srgb_transfer_function_inv(rgb_at_max.g/255)
-    rgb_at_max.b = colors.RGB._srgb_transfer_function_inv(rgb_at_max.b/255)
-    L_cusp = math.pow(1. / max(rgb_at_max.r, rgb_at_max.g, rgb_at_max.b), 1/3)
+    r = colors._linearize(rgb_at_max.r)
+    g = colors._linearize(rgb_at_max.g)
+    b = colors._linearize(rgb_at_max.b)
+    L_cusp = math.pow(1. / max(r, g, b), 1/3)
     C_cusp = L_cusp * S_cusp
 
-    return colors.OKLCH(L_cusp, C_cusp, hue)
+    return L_cusp, C_cusp
+
+# A single step of Halley's method towards the edge of the gamut along the line
+#   from _find_gamut_intersection(), at the point (L, C) on it. k_l, k_m, and
+#   k_s give the hue, and l_dt, m_dt, and s_dt the derivatives of l_, m_, and
+#   s_ along the line. Returns the change in t.
+def _halley_step(L, C, k_l, k_m, k_s, l_dt, m_dt, s_dt):
+    max_float = sys.float_info.max
+
+    l_ = L + C * k_l
+    m_ = L + C * k_m
+    s_ = L + C * k_s
+
+    l = l_ * l_ * l_
+    m = m_ * m_ * m_
+    s = s_ * s_ * s_
+
+    ldt = 3 * l_dt * l_ * l_
+    mdt = 3 * m_dt * m_ * m_
+    sdt = 3 * s_dt * s_ * s_
+
+    ldt2 = 6 * l_dt * l_dt * l_
+    mdt2 = 6 * m_dt * m_dt * m_
+    sdt2 = 6 * s_dt * s_dt * s_
+
+    r = 4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s - 1
+    r1 = 4.0767416621 * ldt - 3.3077115913 * mdt + 0.2309699292 * sdt
+    r2 = 4.0767416621 * ldt2 - 3.3077115913 * mdt2 + 0.2309699292 * sdt2
+
+    u_r = r1 / (r1 * r1 - 0.5 * r * r2)
+    t_r = -r * u_r
+
+    g = -1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s - 1
+    g1 = -1.2684380046 * ldt + 2.6097574011 * mdt - 0.3413193965 * sdt
+    g2 = -1.2684380046 * ldt2 + 2.6097574011 * mdt2 - 0.3413193965 * sdt2
+
+    u_g = g1 / (g1 * g1 - 0.5 * g * g2)
+    t_g = -g * u_g
+
+    b = -0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s - 1
+    b1 = -0.0041960863 * ldt - 0.7034186147 * mdt + 1.7076147010 * sdt
+    b2 = -0.0041960863 * ldt2 - 0.7034186147 * mdt2 + 1.7076147010 * sdt2
+
+    u_b = b1 / (b1 * b1 - 0.5 * b * b2)
+    t_b = -b * u_b
+
+    t_r = t_r if u_r >= 0. else max_float
+    t_g = t_g if u_g >= 0. else max_float
+    t_b = t_b if u_b >= 0. else max_float
+
+    return min(t_r, t_g, t_b)
+
+# Bisects a point (L, C) on the line from _find_gamut_intersection() into
+#   gamut, which is needed near the cusp's discontinuity around h = 264 (where
+#   Halley's method can stall outside the gamut, and the lower half can bulge
+#   past the triangle). The point is bisected towards one on the line which is
+#   verified to be in gamut: (L0, 0) on the grey axis, or failing that (e.g.
+#   with method 'manual' and L0 = -1000), the point level with the cusp.
+#   Should the line miss the gamut altogether, the grey of the point's own
+#   lightness is used instead, which is always in gamut. Returns the new L and
+#   C along with the number of steps taken.
+def _bisect_into_gamut(L, C, L0, L1, C1, cusp_l, ha, hb, tolerance = None):
+    is_in_gamut = colors._is_in_gamut
+
+    L_in, C_in = L0, 0.
+    if not is_in_gamut(L_in, 0., 0., tolerance) and L1 != L0:
+        t_in = (cusp_l - L0) / (L1 - L0)
+        L_in, C_in = cusp_l, t_in * C1
+    if not is_in_gamut(L_in, ha * C_in, hb * C_in, tolerance):
+        L_in, C_in = min(1., max(0., L)), 0.
+
+    dL = L - L_in
+    dC = C - C_in
+    lo, hi = 0., 1.
+    for _ in range(_GAMUT_BISECTION_STEPS):
+        mid = (lo + hi) / 2
+        C = C_in + mid * dC
+        if is_in_gamut(L_in + mid * dL, ha * C, hb * C, tolerance):
+            lo = mid
+        else:
+            hi = mid
+    return L_in + lo * dL, C_in + lo * dC, _GAMUT_BISECTION_STEPS
 
 # I've similarly made this function more flexible for my own ease of use, even
 #   if it is not intended to be user-facing. 
@@ -192,16 +293,58 @@ def find_cusp(hue=None, color=None):
 # Finds intersection of the line defined by 
 #   L = L0 * (1 - t) + t * L1;
 #   C = t * C1;
+#
+# In the upper half, the intersection is refined with Halley's method, to a
+#   precision given by one of the following modes:
+#   - 'fast': a single step, as in the original implementation. The result
+#       may lie very slightly outside the gamut.
+#   - 'fixed': exactly iterations steps (2 by default).
+#   - 'exact': steps until the result is in gamut, which is the default. With
+#       a tolerance, each channel in linear RGB need only be within
+#       [-tolerance, 1 + tolerance], as in is_in_gamut(); otherwise, the result
+#       must round to a valid 8-bit color. At most iterations steps are taken
+#       (MAX_GAMUT_ITERATIONS by default); should that not be enough, the
+#       result is bisected towards a point known to be in gamut for at most
+#       _GAMUT_BISECTION_STEPS more (see below), so the worst case is always
+#       bounded and the result is always in gamut.
+# With return_iterations, the result is returned as a tuple along with the
+#   number of steps taken.
+MAX_GAMUT_ITERATIONS = 8
+_GAMUT_BISECTION_STEPS = 32
+
 def _find_gamut_intersection(L1, C1,
                              color = None,
                              hue = None,
                              L0 = None,
-                             method='hue_dependent'):
+                             method='hue_dependent',
+                             cusp = None,
+                             precision = 'exact',
+                             iterations = None,
+                             tolerance = None,
+                             return_iterations = False):
 
     # Either color or hue may be provided, but exactly one is required. 
     assert (color == None) ^ (hue == None), \
             "Exactly one of color or hue must be provided!"
 
+    if precision == 'fast':
+        iterations = 1
+    elif precision == 'fixed':
+        iterations = 2 if iterations is None else iterations
+    elif precision == 'exact':
+        iterations = MAX_GAMUT_ITERATIONS if iterations is None \
+                        else iterations
+    else:
+        raise ValueError(f"""Unknown precision: '{precision}'!
+Valid precisions are 'fast', 'fixed', and 'exact'.""")
+    if not (isinstance(iterations, int) and iterations >= 0):
+        raise ValueError("Expected a non-negative integer, received" \
+                            + f" '{iterations}'!")
+    if tolerance is not None \
+            and not (isinstance(tolerance, (float, int)) and tolerance >= 0):
+        raise ValueError("Expected a non-negative number, received" \
+                            + f" '{tolerance}'!")
+
     if hue != None:
         assert isinstance(hue, (float, int)), \
                 f"Expected number, received {type(hue)}!"
@@ -216,13 +359,9 @@ def _find_gamut_intersection(L1, C1,
     # a and b must be normalized so a^2 + b^2 == 1
     a, b = colors.OKLCH._get_normalized_ab(hue)
 
-    # Find the cusp of the gamut triangle
-    if abs(hue - 264) >= 1:
+    # Find the cusp of the gamut triangle, unless the caller already has it
+    if cusp is None:
         cusp = find_cusp(hue=hue)
-    else:
-        # This handles a strange case with blues where it can converge
-        #   out-of-gamut, resulting in an infinite loop.
-        cusp = colors.HEX('#023BFB').to_OKLCH()
 
     # Manual method allows for an explicit L0 value. 
     if method == 'manual':
@@ -250,12 +389,21 @@ def _find_gamut_intersection(L1, C1,
         else:
             raise ValueError(f"Unknown method: '{method}'!")
 
+    # The convergence test works on L and C directly, rather than building
+    #   a color each time
+    exact = precision == 'exact'
+    is_in_gamut = colors._is_in_gamut
+    ha, hb = a, b
+
     # Find the intersection for upper and lower half separately
+    n = 0
+    converged = False
     if (((L1 - L0) * cusp.c - (cusp.l - L0) * C1) <= 0.):
         # Lower half
 
         t = cusp.c * L0 / (C1 * cusp.l + cusp.c * (L0 - L1))
-        output = colors.OKLCH(L0 * (1 - t) + t * L1, t * C1, hue)
+        L = L0 * (1 - t) + t * L1
+        C = t * C1
     else:
         # Upper half
 
@@ -263,7 +411,7 @@ def _find_gamut_intersection(L1, C1,
         t = cusp.c * (L0 - 1.) / (C1 * (cusp.l - 1.) + \
             cusp.c * (L0 - L1))
 
-        # Then one step Halley's method
+        # Then refine with Halley's method
         dL = L1 - L0
         dC = C1
 
@@ -275,61 +423,29 @@ def _find_gamut_intersection(L1, C1,
         m_dt = dL + dC * k_m
         s_dt = dL + dC * k_s
 
-
-        # If higher accuracy is required, 2 or 3 iterations of the following
-        #   block can be used:
-        output = colors.OKLCH(L0 * (1 - t) + t * L1, t * C1, hue)
-        while not output.is_in_gamut():
+        while n < iterations:
             L = L0 * (1. - t) + t * L1
             C = t * C1
-
-            l_ = L + C * k_l
-            m_ = L + C * k_m
-            s_ = L + C * k_s
-
-            l = l_ * l_ * l_
-            m = m_ * m_ * m_
-            s = s_ * s_ * s_
-
-            ldt = 3 * l_dt * l_ * l_
-            mdt = 3 * m_dt * m_ * m_
-            sdt = 3 * s_dt * s_ * s_
-
-            ldt2 = 6 * l_dt * l_dt * l_
-            mdt2 = 6 * m_dt * m_dt * m_
-            sdt2 = 6 * s_dt * s_dt * s_
-
-            r = 4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s - 1
-            r1 = 4.0767416621 * ldt - 3.3077115913 * mdt + 0.2309699292 * sdt
-            r2 = 4.0767416621 * ldt2 - 3.3077115913 * mdt2 + \
-                    0.2309699292 * sdt2
-
-            u_r = r1 / (r1 * r1 - 0.5 * r * r2)
-            t_r = -r * u_r
-
-            g = -1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s - 1
-            g1 = -1.2684380046 * ldt + 2.6097574011 * mdt - 0.3413193965 * sdt
-            g2 = -1.2684380046 * ldt2 + 2.6097574011 * mdt2 - \
-                    0.3413193965 * sdt2
-
-            u_g = g1 / (g1 * g1 - 0.5 * g * g2)
-            t_g = -g * u_g
-
-            b = -0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s - 1
-            b1 = -0.0041960863 * ldt - 0.7034186147 * mdt + 1.7076147010 * sdt
-            b2 = -0.0041960863 * ldt2 - 0.7034186147 * mdt2 + \
-                    1.7076147010 * sdt2
-
-            u_b = b1 / (b1 * b1 - 0.5 * b * b2)
-            t_b = -b * u_b
-
-            t_r = t_r if u_r >= 0. else sys.float_info.max
-            t_g = t_g if u_g >= 0. else sys.float_info.max
-            t_b = t_b if u_b >= 0. else sys.float_info.max
-
-            t += min(t_r, t_g, t_b)
-            output = colors.OKLCH(L0 * (1 - t) + t * L1, t * C1, hue)
-
+            if exact and is_in_gamut(L, ha * C, hb * C, tolerance):
+                converged = True
+                break
+            n += 1
+
+            t += _halley_step(L, C, k_l, k_m, k_s, l_dt, m_dt, s_dt)
+
+        L = L0 * (1 - t) + t * L1
+        C = t * C1
+
+    # Should the result not be in gamut, it is bisected into gamut instead
+    if exact and not converged \
+            and not is_in_gamut(L, ha * C, hb * C, tolerance):
+        L, C, steps = _bisect_into_gamut(L, C, L0, L1, C1, cusp.l, ha, hb,
+                                         tolerance)
+        n += steps
+
+    output = colors.OKLCH(L, C, hue)
+    if return_iterations:
+        return output, n
     return output
 ###############################################################################
 #
@@ -372,9 +488,20 @@ def _find_gamut_intersection(L1, C1,
 #           = C_cusp * (1 - color.l) / (1 - L_cusp)
 #
 ###############################################################################
-def _find_chroma_max(color):
+# A cusp which is already known for the color's hue may be passed in, saving it
+#   from being found again both here and in _find_gamut_intersection(). 
+def _find_chroma_max(color, cusp = None):
+    if _cache is not None:
+        key = ('chroma_max',
+               _cache.quantize(color.h % 360),
+               _cache.quantize(color.l))
+        return _cache.lookup(key, _compute_chroma_max, color, cusp)
+    return _compute_chroma_max(color, cusp)
+
+def _compute_chroma_max(color, cusp = None):
     # First, get the cusp
-    cusp = find_cusp(color=color)
+    if cusp is None:
+        cusp = find_cusp(color=color)
 
     # Next, we consider whether our lightness places us in the upper or lower
     #   half:
@@ -388,7 +515,8 @@ def _find_chroma_max(color):
         # Correct for the concavity of the upper half. 
         C = _find_gamut_intersection(color.l, C,
                                      color=color,
-                                     method='preserve_lightness').c
+                                     method='preserve_lightness',
+                                     cusp=cusp).c
 
     return C
 
@@ -420,6 +548,14 @@ def _find_chroma_max(color):
 #
 ###############################################################################
 def _find_lightness_bounds(color):
+    if _cache is not None:
+        key = ('lightness_bounds',
+               _cache.quantize(color.h % 360),
+               _cache.quantize(color.c))
+        return _cache.lookup(key, _compute_lightness_bounds, color)
+    return _compute_lightness_bounds(color)
+
+def _compute_lightness_bounds(color):
     # First, get the cusp
     cusp = find_cusp(color=color)
 
@@ -439,6 +575,156 @@ def _find_lightness_bounds(color):
 
     return (L1, L2)
 
+###############################################################################
+#
+# Cusp lookup table
+#
+# find_cusp(..., use_table=True) reads the cusp from a table sampled evenly
+#   over [0, 360] and lerps between the two nearest samples. The table is built
+#   lazily on first use, or explicitly with build_cusp_table(). 
+#
+# With the default of 3600 samples (every 0.1 degrees), the result is within
+#   0.003 of the exact lightness and 0.001 of the exact chroma for every hue.
+#   This is the same order as the jitter the exact computation already has from
+#   rounding the cusp to 8-bit RGB, so denser tables do not improve on it. 
+#
+# Near h = 264.05 the exact cusp jumps discontinuously (see the note in
+#   _find_gamut_intersection()), and lerping across the jump would be badly
+#   wrong. Any segment whose endpoints differ by more than
+#   _CUSP_TABLE_MAX_STEP is therefore marked, and lookups which land in a
+#   marked segment fall back to the exact computation. 
+#
+###############################################################################
+_CUSP_TABLE_SIZE = 3600
+_CUSP_TABLE_MAX_STEP = 0.01
+_cusp_table = None
+
+def build_cusp_table(size = _CUSP_TABLE_SIZE):
+    global _cusp_table
+
+    if not (isinstance(size, int) and size > 0):
+        raise ValueError(f"Expected a positive integer, received '{size}'!")
+
+    L = []
+    C = []
+    for i in range(size + 1):
+        L_cusp, C_cusp = _compute_cusp(360 * i / size)
+        L.append(L_cusp)
+        C.append(C_cusp)
+
+    # Segments which straddle a discontinuity cannot be interpolated
+    skip = set()
+    for i in range(size):
+        if abs(L[i + 1] - L[i]) > _CUSP_TABLE_MAX_STEP \
+                or abs(C[i + 1] - C[i]) > _CUSP_TABLE_MAX_STEP:
+            skip.add(i)
+
+    _cusp_table = (size, L, C, skip)
+
+def _lookup_cusp(hue):
+    if _cusp_table is None:
+        build_cusp_table()
+    size, L, C, skip = _cusp_table
+
+    x = (hue % 360) * size / 360
+    i = int(x)
+    if i in skip or i >= size:
+        return _compute_cusp(hue)
+
+    t = x - i
+    return _lerp(t, L[i], L[i + 1]), _lerp(t, C[i], C[i + 1])
+
+###############################################################################
+#
+# Memoization
+#
+# Palettes and themes tend to reuse a small set of hues, so find_cusp(),
+#   _find_chroma_max(), and _find_lightness_bounds() can optionally share a
+#   bounded LRU cache. It is disabled by default and is turned on with
+#   enable_cache(). 
+#
+# Keys are quantized by rounding to the given number of digits: the hue for
+#   find_cusp(), plus the lightness for _find_chroma_max() or the chroma for
+#   _find_lightness_bounds(). Any two queries which round to the same key share
+#   a result, so fewer digits trade accuracy for more cache hits. 
+#
+###############################################################################
+class _LRUCache:
+    def __init__(self, maxsize, digits):
+        self.maxsize = maxsize
+        self.digits = digits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def quantize(self, x):
+        return round(x, self.digits)
+
+    # Returns the cached value for key, or computes and caches it
+    def lookup(self, key, compute, *args):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute(*args)
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._entries),
+                    'maxsize': self.maxsize,
+                    'digits': self.digits}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+_cache = None
+
+def enable_cache(maxsize = 4096, digits = 4):
+    global _cache
+
+    if not (isinstance(maxsize, int) and maxsize > 0):
+        raise ValueError(f"Expected a positive integer, received '{maxsize}'!")
+    if not (isinstance(digits, int) and digits >= 0):
+        raise ValueError("Expected a non-negative integer, received" \
+                            + f" '{digits}'!")
+
+    _cache = _LRUCache(maxsize, digits)
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+# Returns a snapshot of the cache's counters, or None if it is disabled
+def cache_info():
+    if _cache is None:
+        return None
+    return _cache.info()
+
+# Empties the cache and resets its counters
+def cache_clear():
+    if _cache is not None:
+        _cache.clear()
+
 # A simple lerp
 def _lerp(t, a, b):
     return a * (1 - t) + b * t
@@ -677,6 +963,34 @@ def darken(t,
         raise ValueError(f"""Unknown method: '{method}'!
 Valid methods are 'relative' and 'absolute'.""")
 
+# Adjusts the hue endpoints of an interpolation so that lerping between them
+#   takes the path given by method
+def _get_hue_path(h1, h2, method):
+    if method == 'shortest':
+        # Ensures hue takes the shortest path
+        if h2 - h1 > 180:
+            return h1 + 360, h2
+        elif h2 - h1 < -180:
+            return h1, h2 + 360
+    elif method == 'longest':
+        # Ensures hue takes the longest path
+        if 0 < h2 - h1 < 180:
+            return h1 + 360, h2
+        elif -180 < h2 - h1 <= 0:
+            return h1, h2 + 360
+    elif method == 'increasing':
+        # Ensures hue is strictly increasing
+        if h2 < h1:
+            return h1, h2 + 360
+    elif method == 'decreasing':
+        # Ensures hue is strictly decreasing
+        if h1 < h2:
+            return h1 + 360, h2
+    else:
+        raise ValueError(f"""Unknown method '{method}'! Valid methods are:
+'shortest', 'longest', 'increasing', 'decreasing', and 'use_OKLAB'.""")
+    return h1, h2
+
 # Linearly interpolate between two colors
 # Hue path is determined by method parameter
 def interpolate(t, color1, color2,
@@ -689,35 +1003,7 @@ def interpolate(t, color1, color2,
     c = _lerp(t, color1.c, color2.c)
 
     # Hue path is determined by method
-    if method == 'shortest':
-        # Ensures hue takes the shortest path
-        if color2.h - color1.h > 180:
-            h = _lerp(t, color1.h + 360, color2.h)
-        elif color2.h - color1.h < -180:
-            h = _lerp(t, color1.h, color2.h + 360)
-        else:
-            h = _lerp(t, color1.h, color2.h)
-    elif method == 'longest':
-        # Ensures hue takes the longest path
-        if 0 < color2.h - color1.h < 180:
-            h = _lerp(t, color1.h + 360, color2.h)
-        elif -180 < color2.h - color1.h <= 0:
-            h = _lerp(t, color1.h, color2.h + 360)
-        else:
-            h = _lerp(t, color1.h, color2.h)
-    elif method == 'increasing':
-        # Ensures hue is strictly increasing
-        if color2.h < color1.h:
-            h = _lerp(t, color1.h, color2.h + 360)
-        else:
-            h = _lerp(t, color1.h, color2.h)
-    elif method == 'decreasing':
-        # Ensures hue is strictly decreasing
-        if color1.h < color2.h:
-            h = _lerp(t, color1.h + 360, color2.h)
-        else:
-            h = _lerp(t, color1.h, color2.h)
-    elif method == 'use_OKLAB':
+    if method == 'use_OKLAB':
         color1 = color1.to_OKLAB()
         color2 = color2.to_OKLAB()
 
@@ -728,8 +1014,8 @@ def interpolate(t, color1, color2,
         c = result.c
         h = result.h
     else:
-        raise ValueError(f"""Unknown method '{method}'! Valid methods are:
-'shortest', 'longest', 'increasing', 'decreasing', and 'use_OKLAB'.""")
+        h1, h2 = _get_hue_path(color1.h, color2.h, method)
+        h = _lerp(t, h1, h2)
 
     ret = colors.OKLCH(l, c, h)
     # Make sure that the color is in-gamut
@@ -739,25 +1025,335 @@ def interpolate(t, color1, color2,
         # Clip it into gamut
         return gamut_clip_preserve_lightness(ret)
 
+# Gets the gamut clipping function for the clip parameter of the gradient
+#   functions below
+def _get_gamut_clip(clip):
+    if clip is None:
+        return None
+    try:
+        return {'hue_dependent': gamut_clip_hue_dependent,
+                'hue_independent': gamut_clip_hue_independent,
+                'preserve_lightness': gamut_clip_preserve_lightness}[clip]
+    except KeyError:
+        raise ValueError(f"""Unknown clip method '{clip}'! Valid methods are:
+'hue_dependent', 'hue_independent', 'preserve_lightness', and None.""")
+
+# Generates n evenly spaced stops from color1 to color2, inclusive. Each stop is
+#   the same as interpolate(t, color1, color2, method) would give, but the
+#   endpoints are only converted and the hue path only chosen once, and only
+#   out-of-gamut stops are clipped. 
+def gradient(color1, color2, n,
+             method = 'shortest',
+             clip = 'preserve_lightness'):
+
+    return multi_gradient([color1, color2], n, method=method, clip=clip)
+
+# As above, but through any number of colors. stops may be a list of colors,
+#   which are spaced evenly, or of (position, color) pairs with positions
+#   increasing from 0 to 1. 
+def multi_gradient(stops, n,
+                   method = 'shortest',
+                   clip = 'preserve_lightness'):
+
+    if not (isinstance(n, int) and n > 0):
+        raise ValueError(f"Expected a positive integer, received '{n}'!")
+    clip = _get_gamut_clip(clip)
+
+    stops = list(stops)
+    if len(stops) < 2:
+        raise ValueError("At least two colors are required for a gradient!")
+    if isinstance(stops[0], colors.Color):
+        stops = [(i / (len(stops) - 1), c) for i, c in enumerate(stops)]
+    positions = [p for p, _ in stops]
+    if positions[0] != 0 or positions[-1] != 1 \
+            or any(p1 > p2 for p1, p2 in zip(positions, positions[1:])):
+        raise ValueError("Stop positions must increase from 0 to 1!")
+
+    # Convert each stop and find each segment's hue path once
+    lch = [__get_OKLCH_if_color(c) for _, c in stops]
+    if method == 'use_OKLAB':
+        ends = [c.to_OKLAB() for c in lch]
+        ends = [(c.l, c.a, c.b) for c in ends]
+    else:
+        ends = [(c.l, c.c, c.h) for c in lch]
+    segments = []
+    for i in range(len(stops) - 1):
+        (l1, x1, y1), (l2, x2, y2) = ends[i], ends[i + 1]
+        if method != 'use_OKLAB':
+            y1, y2 = _get_hue_path(y1, y2, method)
+        segments.append((positions[i], positions[i + 1],
+                         l1, x1, y1, l2, x2, y2))
+
+    ret = []
+    segment = 0
+    for i in range(n):
+        t = i / (n - 1) if n > 1 else 0.
+        while segment < len(segments) - 1 and t > segments[segment][1]:
+            segment += 1
+        p1, p2, l1, x1, y1, l2, x2, y2 = segments[segment]
+        t = (t - p1) / (p2 - p1) if p2 > p1 else 0.
+
+        l = _lerp(t, l1, l2)
+        if method == 'use_OKLAB':
+            c = colors.OKLAB(l, _lerp(t, x1, x2), _lerp(t, y1, y2)).to_OKLCH()
+        else:
+            c = colors.OKLCH(l, _lerp(t, x1, x2), _lerp(t, y1, y2))
+
+        # Make sure that the color is in-gamut
+        if clip is not None and not c.is_in_gamut():
+            c = clip(c)
+        ret.append(c)
+
+    return ret
+
+# Checks whether a color is in gamut. Without an epsilon, this is the same as
+#   color.is_in_gamut(); with one, each channel in linear RGB must be within
+#   [-epsilon, 1 + epsilon]. OKLAB and OKLCH colors are checked without
+#   building an intermediate RGB object. 
+def is_in_gamut(color, epsilon = None):
+    colors.Color._is_color(color)
+    if epsilon is None:
+        return color.is_in_gamut()
+    if not (isinstance(epsilon, (float, int)) and epsilon >= 0):
+        raise ValueError("Expected a non-negative number, received" \
+                            + f" '{epsilon}'!")
+
+    if isinstance(color, (colors.RGB, colors.HEX)):
+        rgb = color.to_RGB()
+        return all(-epsilon <= colors._linearize(x) <= 1 + epsilon \
+                        for x in (rgb.r, rgb.g, rgb.b))
+    lab = color.to_OKLAB()
+    return colors._is_in_gamut(lab.l, lab.a, lab.b, epsilon)
+
 # Gamut clipping:
-def gamut_clip_hue_dependent(color):
+#   precision, iterations, and tolerance choose how precisely the edge of the
+#   gamut is found, as described for _find_gamut_intersection()
+def gamut_clip_hue_dependent(color,
+                             precision = 'exact',
+                             iterations = None,
+                             tolerance = None):
     _color = __get_OKLCH_if_color(color)
     if color.is_in_gamut(): return color
 
-    return _find_gamut_intersection(_color.l, _color.c, color=_color)
+    return _find_gamut_intersection(_color.l, _color.c, color=_color,
+                                    precision=precision,
+                                    iterations=iterations,
+                                    tolerance=tolerance)
 
-def gamut_clip_hue_independent(color):
+def gamut_clip_hue_independent(color,
+                               precision = 'exact',
+                               iterations = None,
+                               tolerance = None):
     _color = __get_OKLCH_if_color(color)
     if color.is_in_gamut(): return color
 
     return _find_gamut_intersection(_color.l, _color.c,
                                     color=_color,
-                                    method='hue_dependent')
-
-def gamut_clip_preserve_lightness(color):
+                                    method='hue_independent',
+                                    precision=precision,
+                                    iterations=iterations,
+                                    tolerance=tolerance)
+
+def gamut_clip_preserve_lightness(color,
+                                  precision = 'exact',
+                                  iterations = None,
+                                  tolerance = None):
     _color = __get_OKLCH_if_color(color)
     if color.is_in_gamut(): return color
 
     return _find_gamut_intersection(_color.l, _color.c,
                                     color=_color,
-                                    method='preserve_lightness')
+                                    method='preserve_lightness',
+                                    precision=precision,
+                                    iterations=iterations,
+                                    tolerance=tolerance)
+
+###############################################################################
+#
+# Hue rotation and harmonies
+#
+# Rotating a color's hue at a fixed chroma easily leaves the gamut, since the
+#   maximum chroma varies widely from one hue to the next. Instead, colors keep
+#   their lightness and their chroma relative to the maximum in-gamut chroma at
+#   that lightness, i.e. color.c / _find_chroma_max(color), and any which still
+#   end up out of gamut are clipped together with arrays.gamut_clip(). 
+#
+# Both functions accept either a single color or a color array. The cusp for
+#   each hue is only found once per call, and shared between every color which
+#   needs it. 
+#
+###############################################################################
+
+# The hue offsets of each fixed harmony, in degrees
+_HARMONIES = {
+    'complementary': (0, 180),
+    'split_complementary': (0, 150, 210),
+    'triadic': (0, 120, 240),
+    'tetradic': (0, 90, 180, 270),
+}
+
+# Rotates every (l, c, h) triplet by each of the offsets, giving an OKLCHArray
+#   for each offset
+def _rotate_triplets(triplets, offsets, clip):
+    from . import arrays
+
+    cusps = {}
+    def chroma_max(l, h):
+        # There is no chroma at either end of the lightness axis
+        if not 0 < l < 1:
+            return 0.
+        if h not in cusps:
+            cusps[h] = find_cusp(hue=h)
+        return _find_chroma_max(colors.OKLCH(l, 0., h), cusp=cusps[h])
+
+    relative = []
+    for l, c, h in triplets:
+        c_max = chroma_max(l, h % 360)
+        relative.append(c / c_max if c_max > 0 else None)
+
+    ret = []
+    for offset in offsets:
+        data = array('d')
+        for (l, c, h), r in zip(triplets, relative):
+            # A color keeps its own chroma if it isn't rotated at all, or if it
+            #   has no relative chroma to keep
+            if r is not None and offset % 360:
+                c = r * chroma_max(l, (h + offset) % 360)
+            data.extend((l, c, (h + offset) % 360))
+
+        out = arrays.OKLCHArray(data)
+        if clip is not None:
+            out = arrays.gamut_clip(out, method=clip)
+        ret.append(out)
+    return ret
+
+def _rotate(color, offsets, clip):
+    from . import arrays
+
+    # Validate clip before doing any work
+    _get_gamut_clip(clip)
+
+    if isinstance(color, arrays.ColorArray):
+        return _rotate_triplets(color.to_OKLCH().to_triplets(), offsets, clip)
+
+    color = __get_OKLCH_if_color(color)
+    return [out[0] for out in \
+                _rotate_triplets([(color.l, color.c, color.h)], offsets, clip)]
+
+# Rotates the hue of a color by the given number of degrees, keeping its
+#   lightness and relative chroma. color may be a color object, giving an OKLCH
+#   color, or a color array, giving an OKLCHArray. 
+def rotate_hue(degrees, color,
+               clip = 'preserve_lightness'):
+
+    if not isinstance(degrees, (float, int)):
+        raise ValueError(f"Expected number, received {type(degrees)}!")
+
+    return _rotate(color, (degrees,), clip)[0]
+
+# Generates a color harmony as a list, with one entry for each hue in the
+#   scheme; each entry is an OKLCH color, or an OKLCHArray if color is a color
+#   array. The fixed schemes start from the color itself:
+#   - 'complementary': 0, 180
+#   - 'split_complementary': 0, 150, 210
+#   - 'triadic': 0, 120, 240
+#   - 'tetradic': 0, 90, 180, 270
+#   while 'analogous' gives n hues spaced by angle degrees and centered on the
+#   color. 
+def harmony(color,
+            scheme = 'complementary',
+            n = 3,
+            angle = 30,
+            clip = 'preserve_lightness'):
+
+    if scheme == 'analogous':
+        if not (isinstance(n, int) and n > 0):
+            raise ValueError(f"Expected a positive integer, received '{n}'!")
+        if not isinstance(angle, (float, int)):
+            raise ValueError(f"Expected number, received {type(angle)}!")
+        offsets = [(i - (n - 1) / 2) * angle for i in range(n)]
+
+    elif scheme in _HARMONIES:
+        offsets = _HARMONIES[scheme]
+
+    else:
+        raise ValueError(f"""Unknown scheme: '{scheme}'! Valid schemes are:
+'complementary', 'split_complementary', 'triadic', 'tetradic', and 'analogous'.""")
+
+    return _rotate(color, offsets, clip)
+
+###############################################################################
+#
+# Parallel execution
+#
+# All of the above is pure python and therefore bound to a single core, so
+#   map_parallel() splits large batches of colors across a pool of processes.
+#   Colors are sent to and from the workers as packed buffers of OKLCH
+#   triplets rather than as pickled color objects. 
+#
+# Since op is sent to the workers, it must be picklable; that is, a function
+#   defined at the top level of a module (such as those above), not a lambda. 
+#
+###############################################################################
+
+# Packs colors into a buffer of OKLCH triplets
+def _pack_OKLCH(color_list):
+    data = array('d')
+    for color in color_list:
+        color = color.to_OKLCH()
+        data.extend((color.l, color.c, color.h))
+    return data.tobytes()
+
+def _unpack_OKLCH(buffer):
+    data = array('d')
+    data.frombytes(buffer)
+    return [colors.OKLCH(data[i], data[i+1], data[i+2]) \
+                for i in range(0, len(data), 3)]
+
+# Runs in the worker processes
+def _map_chunk(op, args, kwargs, buffer):
+    return _pack_OKLCH([op(*args, color, **kwargs) \
+                            for color in _unpack_OKLCH(buffer)])
+
+# Applies op to every color, returning a list of OKLCH colors in input order.
+#   Each color is converted to OKLCH, whatever its type, and passed following
+#   any other positional arguments, i.e. op(*args, color, **kwargs), so
+#   map_parallel(lighten, colors, 0.2) calls lighten(0.2, color) for each
+#   color. 
+def map_parallel(op, color_list, *args,
+                 workers = None,
+                 chunksize = 4096,
+                 **kwargs):
+
+    if not callable(op):
+        raise ValueError(f"Expected callable, received '{type(op)}'!")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if not (isinstance(workers, int) and workers > 0):
+        raise ValueError(f"Expected a positive integer, received '{workers}'!")
+    if not (isinstance(chunksize, int) and chunksize > 0):
+        raise ValueError("Expected a positive integer, received" \
+                            + f" '{chunksize}'!")
+
+    color_list = list(color_list)
+    for color in color_list:
+        colors.Color._is_color(color)
+
+    # A pool isn't worth starting for a single chunk, but the colors still go
+    #   through the same buffers so that op sees the same OKLCH colors
+    if workers == 1 or len(color_list) <= chunksize:
+        return _unpack_OKLCH(_map_chunk(op, args, kwargs,
+                                        _pack_OKLCH(color_list)))
+
+    buffers = [_pack_OKLCH(color_list[i:i+chunksize]) \
+                    for i in range(0, len(color_list), chunksize)]
+
+    ret = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for buffer in executor.map(_map_chunk,
+                                   [op] * len(buffers),
+                                   [args] * len(buffers),
+                                   [kwargs] * len(buffers),
+                                   buffers):
+            ret.extend(_unpack_OKLCH(buffer))
+    return ret
@@ -0,0 +1,67 @@
+from oklch import aio, colors, tools
+from oklch.arrays import RGBArray, OKLCHArray, gamut_clip
+
+from array import array
+import asyncio
+import random
+
+def _reference(arr, i):
+    x, y, z = arr._channels()
+    if isinstance(i, slice):
+        return list(zip(x[i], y[i], z[i]))
+    return (x[i], y[i], z[i])
+
+def test_getitem_layouts():
+    values = [float(v) for v in range(30)]
+    arrays = [RGBArray(values),
+              RGBArray.from_buffer(array('d', values), layout='planar'),
+              RGBArray.from_buffer(bytes(range(30)), 'B'),
+              RGBArray.from_buffer(bytes(range(30)), 'B', 'planar')]
+    slices = [slice(None), slice(2, 7), slice(-3, None), slice(1, 9, 3),
+              slice(None, None, -1), slice(8, 0, -2), slice(5, 5),
+              slice(-20, 20)]
+
+    for arr in arrays:
+        for i in range(-len(arr), len(arr)):
+            c = arr[i]
+            assert (c.r, c.g, c.b) == _reference(arr, i)
+        for s in slices:
+            assert arr[s].to_triplets() == _reference(arr, s)
+
+_CLIPS = {'hue_dependent': tools.gamut_clip_hue_dependent,
+          'hue_independent': tools.gamut_clip_hue_independent,
+          'preserve_lightness': tools.gamut_clip_preserve_lightness}
+
+def _out_of_gamut_colors():
+    rng = random.Random(3)
+    ret = [colors.OKLCH(rng.uniform(-.1, 1.1), rng.uniform(0, .5),
+                        rng.uniform(0, 360)) for _ in range(500)]
+    # The cusp jumps near 264, where the solver needs its fallback
+    ret += [colors.OKLCH(rng.uniform(0, 1), rng.uniform(.2, .5),
+                         263 + 2 * i / 200) for i in range(200)]
+    return ret
+
+def test_gamut_clip_matches_scalar():
+    lch = _out_of_gamut_colors()
+    arr = OKLCHArray.from_colors(lch)
+
+    for method, clip in _CLIPS.items():
+        expected = [clip(c) for c in lch]
+        for out in (gamut_clip(arr, method=method),
+                    gamut_clip(arr.to_OKLAB(), method=method).to_OKLCH()):
+            for c, e in zip(out, expected):
+                assert abs(c.l - e.l) < 1e-9 and abs(c.c - e.c) < 1e-9
+
+        # aio gives the same colors for list and array input
+        listed = asyncio.run(aio.gamut_clip(lch, method=method,
+                                            chunksize=64))
+        batched = asyncio.run(aio.gamut_clip(arr, method=method,
+                                             chunksize=64))
+        assert [(c.l, c.c) for c in listed] == [(c.l, c.c) for c in batched]
+
+def test_gamut_clip_always_in_gamut():
+    arr = OKLCHArray.from_colors(_out_of_gamut_colors())
+    for method in _CLIPS:
+        for iterations in (0, 1, None):
+            out = gamut_clip(arr, method=method, iterations=iterations)
+            assert all(c.is_in_gamut() for c in out)
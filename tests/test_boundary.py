@@ -0,0 +1,23 @@
+from oklch.boundary import GamutBoundary
+
+def test_no_interpolation_across_264():
+    boundary = GamutBoundary()
+    for i in range(101):
+        h = 263 + i / 50
+        for l in (0.3, 0.46, 0.6):
+            assert abs(boundary.max_chroma(l, h) \
+                       - boundary.max_chroma(l, h, refine=True)) < 0.005
+        for c in (0.05, 0.15, 0.25):
+            approx = boundary.lightness_bounds(c, h)
+            exact = boundary.lightness_bounds(c, h, refine=True)
+            assert abs(approx[0] - exact[0]) < 0.005
+            assert abs(approx[1] - exact[1]) < 0.005
+
+def test_save_and_load(tmp_path):
+    boundary = GamutBoundary(hue_steps=36, lightness_steps=10,
+                             chroma_steps=5)
+    path = tmp_path / 'boundary.bin'
+    boundary.save(path)
+    loaded = GamutBoundary.load(path)
+    assert loaded._skip == boundary._skip
+    assert loaded.max_chroma(0.46, 264.6) == boundary.max_chroma(0.46, 264.6)
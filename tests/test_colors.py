@@ -0,0 +1,29 @@
+from oklch.colors import RGB, HEX, OKLCH, FrozenRGB, FrozenHEX
+
+def test_frozen_equality_is_consistent_with_hash():
+    frozen = FrozenRGB(255, 0, 0)
+    mutable = RGB(255, 0, 0)
+
+    assert frozen == FrozenRGB(255, 0, 0)
+    assert hash(frozen) == hash(FrozenRGB(255, 0, 0))
+    assert frozen == mutable.freeze()
+    assert frozen != FrozenHEX('#FF0000')
+
+    # Mutable colors are compared by identity, so never equal a frozen one
+    assert frozen != mutable and mutable != frozen
+    assert not frozen == mutable and not mutable == frozen
+    assert frozen.key() == mutable.key()
+
+    assert len({frozen, mutable, FrozenRGB(255, 0, 0)}) == 2
+    lookup = {frozen: 'red'}
+    assert mutable not in lookup
+    assert mutable.freeze() in lookup
+
+def test_frozen_is_immutable():
+    frozen = OKLCH(0.5, 0.1, 120).freeze()
+    try:
+        frozen.l = 0.6
+    except AttributeError:
+        pass
+    else:
+        assert False
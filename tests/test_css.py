@@ -0,0 +1,49 @@
+from oklch import colors, css
+
+import pytest
+
+def test_percentage_rgb_to_hex():
+    color = css.parse('rgb(50% 0% 100%)')
+    assert (color.r, color.g, color.b) == (128, 0, 255)
+    assert css.serialize(color, 'HEX') == '#8000FF'
+    assert css.serialize(css.parse('rgba(10%, 20%, 30%, 50%)'), 'HEX') \
+            == '#1A334D'
+    assert css.serialize(css.parse('rgb(127.4 300 -5)'), 'HEX') == '#7FFF00'
+
+def test_rewrite_percentage_rgb_to_hex():
+    text = 'a { color: rgb(50% 0% 0%); border-color: rgb(0% 100% 0% / 50%); }'
+    assert css.rewrite(text, space='HEX') \
+            == 'a { color: #800000; border-color: #00FF0080; }'
+
+def test_rgb_syntax():
+    for text in ('rgb(1, 2, 3)', 'rgb(1 2 3)'):
+        color = css.parse(text)
+        assert (color.r, color.g, color.b) == (1, 2, 3)
+    assert css.parse('rgba(1,2,3,.5)', alpha=True)[1] == .5
+    assert css.parse('rgb(1 2 3 / 50%)', alpha=True)[1] == .5
+
+    for text in ('rgb(255)', 'rgb(1 2)', 'rgb(255,0)', 'rgb(10.5.5)',
+                 'rgb(1, 2 3)', 'rgb(1 2, 3)', 'rgb(1 2 3, 0.5)'):
+        with pytest.raises(ValueError):
+            css.parse(text)
+        text = f'a {{ color: {text}; }}'
+        assert css.rewrite(text, space='HEX') == text
+
+def test_named_colors_opt_in():
+    text = 'a{font-family: Gold, serif; content: counter(tan); color: red}'
+    assert css.rewrite(text, space='HEX') == text
+    assert css.find_colors(text) == []
+    assert css.rewrite(text, space='HEX', named=True) \
+            == 'a{font-family: #FFD700, serif; content: counter(#D2B48C);' \
+                + ' color: #FF0000}'
+
+def test_named_colors_follow_color_dict():
+    assert css.parse('red').hex_code == '#FF0000'
+    colors.Color.ColorDict['Zzcolor'] = '#123456'
+    try:
+        assert css.parse('zzcolor').hex_code == '#123456'
+        assert css.rewrite('a{color:zzcolor}', named=True) == 'a{color:#123456}'
+    finally:
+        del colors.Color.ColorDict['Zzcolor']
+    with pytest.raises(ValueError):
+        css.parse('zzcolor')
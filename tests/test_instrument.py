@@ -0,0 +1,15 @@
+import oklch
+from oklch import colors, tools
+
+def test_chained_conversions_are_counted():
+    with oklch.profile() as stats:
+        tools.lighten(0.1, colors.HEX('#123456'))
+
+    # HEX -> OKLCH goes through HEX -> OKLAB and then OKLAB._to_OKLCH()
+    assert stats['colors.OKLAB.to_OKLCH']['calls'] >= 1
+    assert stats['colors.RGB.to_OKLAB']['calls'] >= 1
+    assert not any(name.split('.')[-1].startswith('_to_') for name in stats)
+    assert stats['tools.lighten']['conversions'] \
+            == sum(entry['calls'] for name, entry in stats.items() \
+                       if name.split('.')[-1].startswith('to_'))
+    assert colors.OKLAB.to_OKLCH is colors.OKLAB._to_OKLCH
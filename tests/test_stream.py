@@ -0,0 +1,18 @@
+from oklch import tools
+from oklch.stream import Pipeline
+
+def test_small_cache():
+    # Chunks mix pixels already in the memo with new ones, so emptying it
+    #   part way through a chunk must not lose the old ones
+    distinct = [bytes((10 * i, 20 + i, 30)) for i in range(8)]
+    pixels = b''.join(distinct[i] for i in (0, 1, 2, 3, 0, 4, 5, 6,
+                                            7, 1, 2, 3, 4, 0, 6, 5))
+    pipeline = Pipeline().then(tools.lighten, 0.1)
+    expected = b''.join(pipeline.process(pixels))
+
+    for chunk_size in (1, 2, 4, 8):
+        for max_cache in (0, 1, 5, 16):
+            small = Pipeline(chunk_size=chunk_size, max_cache=max_cache) \
+                        .then(tools.lighten, 0.1)
+            assert b''.join(small.process(pixels)) == expected
+            assert len(small._cache) <= max(max_cache, chunk_size)
@@ -0,0 +1,76 @@
+from oklch import tools
+from oklch.colors import HEX, OKLCH
+
+import random
+
+# Hues either side of the cusp's discontinuity at h = 264.05, where the solver
+#   used to loop forever, and then to bisect towards an out-of-gamut point
+_HUES = [263 + i / 50 for i in range(101)]
+
+def test_gamut_intersection_near_264_is_in_gamut():
+    rng = random.Random(264)
+    for h in _HUES:
+        for _ in range(20):
+            L, C = rng.uniform(0, 1), rng.uniform(0, 0.4)
+            for method in ('hue_dependent', 'hue_independent',
+                           'preserve_lightness'):
+                for iterations in (0, 1, None):
+                    output = tools._find_gamut_intersection(
+                        L, C, hue=h, method=method, iterations=iterations)
+                    assert output.is_in_gamut(), (L, C, h, method)
+
+def test_horizontal_intersection_near_264():
+    output = tools._find_gamut_intersection(0.9, 0.27362,
+                                            hue=263.328,
+                                            method='manual',
+                                            L0=-1000)
+    # No color of this chroma is in gamut (the most is about 0.271), so the
+    #   nearest in-gamut color is returned rather than oklch(-1000, 0, h)
+    assert output.is_in_gamut()
+    assert abs(output.l - 0.525) < 0.01
+    assert abs(output.c - 0.27362) < 0.01
+
+    # The bisection fallback must also stay at (nearly) the same chroma
+    for h in _HUES:
+        cusp = tools.find_cusp(h)
+        C = cusp.c / 2
+        L = 1 - (1 - cusp.l) * (C / cusp.c)
+        for iterations in (0, 1):
+            output = tools._find_gamut_intersection(L, C,
+                                                    hue=h,
+                                                    method='manual',
+                                                    L0=-1000,
+                                                    iterations=iterations)
+            assert output.is_in_gamut()
+            assert cusp.l <= output.l <= 1
+            assert abs(output.c - C) < 1e-3
+
+def test_lightness_bounds_near_264():
+    for h in _HUES:
+        color = OKLCH(0.5, 0.2736, h)
+        if not color.is_in_gamut():
+            continue
+        L1, L2 = tools._find_lightness_bounds(color)
+        assert 0 <= L1 <= L2 <= 1
+        assert color.l <= L2
+        lightened = tools.lighten(0.5, color)
+        assert lightened.is_in_gamut()
+        assert lightened.l >= color.l
+
+# Marks whether op was given an OKLCH color; must be picklable for the pool
+def _mark_type(color):
+    return OKLCH(0.5 if type(color) is OKLCH else 1., 0., 0.)
+
+def test_map_parallel_always_passes_OKLCH():
+    palette = [HEX('#123456'), OKLCH(0.5, 0.1, 30), HEX('#FFFFFF')] * 4
+    for workers, chunksize in ((1, 4096), (2, 4096), (2, 5)):
+        out = tools.map_parallel(_mark_type, palette, workers=workers,
+                                 chunksize=chunksize)
+        assert [c.l for c in out] == [0.5] * len(palette)
+
+    # In-gamut colors come back from clipping as the same color either way
+    single = tools.map_parallel(tools.gamut_clip_hue_dependent, palette)
+    pooled = tools.map_parallel(tools.gamut_clip_hue_dependent, palette,
+                                workers=2, chunksize=5)
+    assert [(c.l, c.c, c.h) for c in single] \
+            == [(c.l, c.c, c.h) for c in pooled]